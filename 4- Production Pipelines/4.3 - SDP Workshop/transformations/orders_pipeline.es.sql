@@ -27,7 +27,9 @@ SELECT
   _metadata.file_name AS source_file
 FROM STREAM read_files( -- Procesa incrementalmente archivos nuevos con Auto Loader
   "${source}/orders",  -- Usa la variable de configuración 'source' del pipeline
-  format => 'json'
+  format => 'json',
+  -- Esquema fijo (Includes/SchemaRegistry, workshop.orders v1): evita inferir en cada arranque
+  schema => 'order_id STRING, order_timestamp STRING, customer_id STRING, notifications STRUCT<email: BOOLEAN, sms: BOOLEAN>'
 );
 
 -------------------------------------------------------
@@ -79,5 +81,7 @@ GROUP BY date(order_timestamp);
 -- 3. Sustitución de variables: ${source} se reemplaza en tiempo de ejecución
 -- 4. Las tablas en streaming usan checkpoints para procesamiento incremental
 -- 5. Las vistas materializadas manejan eficientemente refrescos completos
+-- 6. count(DISTINCT) obliga a recomputar gold.order_summary completo;
+--    utilities/sketches.py ofrece una variante incremental con sketches HLL
 -------------------------------------------------------
 
@@ -0,0 +1,158 @@
+# utilities/latest_state.py
+
+from pyspark.sql import functions as F
+import hashlib
+import time
+import uuid
+
+# Esquema de los eventos que genera 0 - SETUP (generate_status_updates)
+STATUS_SCHEMA = "order_id STRING, order_status STRING, status_timestamp DOUBLE"
+STATUSES = ["placed", "preparing", "on the way", "delivered", "canceled"]
+
+
+def latest_per_key(df, keys, sequence_column: str):
+    """
+    Una fila por clave: la de mayor `sequence_column`. Usa max_by en una sola
+    agregación, sin ordenar cada partición como ROW_NUMBER.
+    """
+    columns = [c for c in df.columns if c not in keys]
+    latest = F.max_by(F.struct(*[F.col(c) for c in columns]), F.col(sequence_column))
+    return df.groupBy(*keys).agg(latest.alias("_latest")).select(*keys, "_latest.*")
+
+
+def create_latest_state_table(spark, state_table: str, schema: str) -> None:
+    """
+    Crear la tabla de estado con las columnas del evento.
+    """
+    spark.sql(f"CREATE TABLE IF NOT EXISTS {state_table} ({schema}, updated_at TIMESTAMP)")
+
+
+def merge_latest_state(batch_df, batch_id: int, state_table: str, keys, sequence_column: str,
+                       app_id: str) -> dict:
+    """
+    Aplicar un micro-batch de eventos a `state_table`. Un evento solo reemplaza
+    la fila de su clave si su secuencia es mayor; los eventos atrasados se ignoran.
+    El costo depende del tamaño del batch, no del histórico. `app_id`
+    identifica el stream (su checkpoint) en la escritura idempotente.
+    """
+    spark = batch_df.sparkSession
+    latest_per_key(batch_df, keys, sequence_column).createOrReplaceTempView("latest_state_updates")
+
+    condition = " AND ".join(f"t.`{k}` = s.`{k}`" for k in keys)
+    columns = list(batch_df.columns)
+    sets = ", ".join(f"t.`{c}` = s.`{c}`" for c in columns if c not in keys)
+    # Escritura idempotente: si el batch se reintenta, Delta ignora el MERGE repetido
+    spark.conf.set("spark.databricks.delta.write.txnAppId", app_id)
+    spark.conf.set("spark.databricks.delta.write.txnVersion", str(batch_id))
+    try:
+        spark.sql(f"""
+            MERGE INTO {state_table} t
+            USING latest_state_updates s
+            ON {condition}
+            WHEN MATCHED AND s.`{sequence_column}` > t.`{sequence_column}` THEN UPDATE SET
+              {sets}, t.updated_at = current_timestamp()
+            WHEN NOT MATCHED THEN INSERT ({", ".join(f"`{c}`" for c in columns)}, updated_at)
+              VALUES ({", ".join(f"s.`{c}`" for c in columns)}, current_timestamp())
+        """)
+    finally:
+        spark.conf.unset("spark.databricks.delta.write.txnAppId")
+        spark.conf.unset("spark.databricks.delta.write.txnVersion")
+
+    metrics = spark.sql(f"DESCRIBE HISTORY {state_table} LIMIT 1").collect()[0]["operationMetrics"] or {}
+    return {k: int(metrics.get(k, 0)) for k in ("numSourceRows", "numTargetRowsUpdated", "numTargetRowsInserted")}
+
+
+def start_latest_status_stream(spark, source_path: str, state_table: str, checkpoint_location: str,
+                               keys=("order_id",), sequence_column: str = "status_timestamp",
+                               schema: str = STATUS_SCHEMA):
+    """
+    Leer incrementalmente los eventos JSON de `source_path` (p. ej.
+    {working_dir}/status) y mantener el último estado por pedido en `state_table`.
+    Devuelve el StreamingQuery; se ejecuta con trigger availableNow.
+    """
+    keys = list(keys)
+    create_latest_state_table(spark, state_table, schema)
+    # batch_id vuelve a 0 con un checkpoint nuevo: el appId debe cambiar con él para que Delta no descarte los batches
+    app_id = f"latest_state:{hashlib.sha256(checkpoint_location.encode()).hexdigest()[:16]}"
+    return (spark.readStream
+            .format("cloudFiles")
+            .option("cloudFiles.format", "json")
+            .schema(schema)
+            .load(source_path)
+            .writeStream
+            .foreachBatch(lambda df, batch_id: merge_latest_state(df, batch_id, state_table, keys, sequence_column, app_id))
+            .option("checkpointLocation", checkpoint_location)
+            .trigger(availableNow=True)
+            .start())
+
+
+def _synthetic_status_events(spark, num_events: int, num_orders: int, num_batches: int):
+    # Timestamps únicos; el lote de llegada se asigna por hash, así lotes posteriores traen eventos más antiguos
+    return (spark.range(num_events)
+            .select(
+                F.format_string("ORD%08d", F.col("id") % num_orders).alias("order_id"),
+                F.element_at(F.array(*[F.lit(s) for s in STATUSES]),
+                             (F.col("id") % len(STATUSES) + 1).cast("int")).alias("order_status"),
+                (F.lit(1704067200.0) + F.col("id")).alias("status_timestamp"),
+                F.pmod(F.hash("id"), F.lit(num_batches)).alias("batch")
+            ))
+
+
+def benchmark_latest_state(spark, schema_name: str, num_events: int = 1_000_000, num_orders: int = 100_000,
+                           num_batches: int = 10, results_table: str = None):
+    """
+    Llegan `num_events` eventos en `num_batches` lotes. Después de cada lote se
+    compara aplicar solo el lote con merge_latest_state contra recalcular
+    ROW_NUMBER() sobre todo el histórico. Devuelve los tiempos y el throughput
+    por lote y verifica que ambos estados coincidan al final.
+    """
+    events_table = f"{schema_name}.status_bench_events"
+    state_table = f"{schema_name}.status_bench_state"
+    window_table = f"{schema_name}.status_bench_window"
+    results_table = results_table or f"{schema_name}.status_bench_results"
+    keys = ["order_id"]
+
+    events = _synthetic_status_events(spark, num_events, num_orders, num_batches)
+    events.write.mode("overwrite").saveAsTable(events_table)
+    spark.sql(f"DROP TABLE IF EXISTS {state_table}")
+    create_latest_state_table(spark, state_table, STATUS_SCHEMA)
+    app_id = f"latest_state_benchmark:{uuid.uuid4().hex}"
+
+    results = []
+    for batch in range(num_batches):
+        batch_df = spark.table(events_table).filter(F.col("batch") == batch).drop("batch")
+        batch_events = batch_df.count()
+
+        start = time.time()
+        metrics = merge_latest_state(batch_df, batch, state_table, keys, "status_timestamp", app_id)
+        incremental_seconds = time.time() - start
+
+        start = time.time()
+        spark.sql(f"""
+            CREATE OR REPLACE TABLE {window_table} AS
+            SELECT order_id, order_status, status_timestamp FROM (
+              SELECT *, ROW_NUMBER() OVER (PARTITION BY order_id ORDER BY status_timestamp DESC) AS rn
+              FROM {events_table} WHERE batch <= {batch}
+            ) WHERE rn = 1
+        """)
+        window_seconds = time.time() - start
+
+        stale = metrics["numSourceRows"] - metrics["numTargetRowsUpdated"] - metrics["numTargetRowsInserted"]
+        results.append((batch, batch_events, stale, round(incremental_seconds, 3), round(window_seconds, 3),
+                        round(batch_events / max(incremental_seconds, 1e-6)),
+                        round(batch_events / max(window_seconds, 1e-6))))
+        print(f"[INFO] Lote {batch}: {batch_events} eventos, incremental {incremental_seconds:.2f}s, "
+              f"ventana {window_seconds:.2f}s")
+
+    mismatches = (spark.table(state_table).select("order_id", "order_status", "status_timestamp")
+                  .exceptAll(spark.table(window_table)).count())
+    if mismatches:
+        raise Exception(f"El estado incremental difiere del cálculo con ventana en {mismatches} filas")
+
+    df = (spark.createDataFrame(results, "batch int, batch_events long, stale_keys long, incremental_seconds double, "
+                                         "window_seconds double, incremental_events_per_s long, "
+                                         "window_events_per_s long")
+          .withColumn("total_events", F.lit(num_events))
+          .withColumn("run_at", F.current_timestamp()))
+    df.write.mode("append").saveAsTable(results_table)
+    return df
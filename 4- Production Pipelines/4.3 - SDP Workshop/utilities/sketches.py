@@ -0,0 +1,126 @@
+# utilities/sketches.py
+
+from pyspark.sql import functions as F
+import hashlib
+import math
+
+# Rango de lgConfigK admitido por hll_sketch_agg en Databricks
+MIN_LG_CONFIG_K = 4
+MAX_LG_CONFIG_K = 21
+
+
+def lg_config_k_for_error(relative_error: float) -> int:
+    """
+    Devolver el lgConfigK más pequeño cuyo error estándar relativo
+    (1.04 / sqrt(2^k)) no supera `relative_error`.
+    """
+    if relative_error <= 0:
+        raise ValueError("relative_error debe ser mayor que 0")
+    lg_config_k = math.ceil(math.log2((1.04 / relative_error) ** 2))
+    return min(max(lg_config_k, MIN_LG_CONFIG_K), MAX_LG_CONFIG_K)
+
+
+def relative_error_for_lg_config_k(lg_config_k: int) -> float:
+    """
+    Error estándar relativo de un sketch HLL con `lg_config_k`.
+    """
+    return 1.04 / math.sqrt(2 ** lg_config_k)
+
+
+def create_sketch_state_table(spark, state_table: str, lg_config_k: int) -> None:
+    """
+    Crear la tabla de estado con un sketch HLL serializado por día.
+    Falla si la tabla ya existe con un lgConfigK distinto, porque
+    hll_union no puede combinar sketches de distinta precisión.
+    """
+    spark.sql(f"""
+        CREATE TABLE IF NOT EXISTS {state_table} (
+          order_date DATE,
+          total_daily_orders BIGINT,
+          customer_sketch BINARY,
+          lg_config_k INT,
+          updated_at TIMESTAMP
+        )
+    """)
+    existing = [r.lg_config_k for r in spark.table(state_table).select("lg_config_k").distinct().collect()]
+    if existing and existing != [lg_config_k]:
+        raise Exception(
+            f"La tabla {state_table} usa lgConfigK={existing}; "
+            f"no se puede combinar con lgConfigK={lg_config_k}. Usa otra tabla de estado."
+        )
+
+
+def merge_order_sketches(batch_df, batch_id: int, state_table: str, lg_config_k: int, app_id: str) -> None:
+    """
+    Agregar un micro-batch de pedidos por día y combinarlo con el estado
+    existente mediante hll_union. El costo depende solo del tamaño del batch.
+    `app_id` identifica el stream (su checkpoint): los batch_id solo son
+    únicos dentro de un mismo checkpoint.
+    """
+    spark = batch_df.sparkSession
+    (batch_df
+        .groupBy(F.to_date("order_timestamp").alias("order_date"))
+        .agg(
+            F.count("*").alias("total_daily_orders"),
+            F.expr(f"hll_sketch_agg(customer_id, {lg_config_k})").alias("customer_sketch")
+        )
+        .createOrReplaceTempView("order_sketch_updates"))
+
+    # Escritura idempotente: si el batch se reintenta, Delta ignora el MERGE repetido
+    spark.conf.set("spark.databricks.delta.write.txnAppId", app_id)
+    spark.conf.set("spark.databricks.delta.write.txnVersion", str(batch_id))
+    try:
+        spark.sql(f"""
+            MERGE INTO {state_table} t
+            USING order_sketch_updates s
+            ON t.order_date = s.order_date
+            WHEN MATCHED THEN UPDATE SET
+              t.total_daily_orders = t.total_daily_orders + s.total_daily_orders,
+              t.customer_sketch = hll_union(t.customer_sketch, s.customer_sketch),
+              t.updated_at = current_timestamp()
+            WHEN NOT MATCHED THEN INSERT (order_date, total_daily_orders, customer_sketch, lg_config_k, updated_at)
+              VALUES (s.order_date, s.total_daily_orders, s.customer_sketch, {lg_config_k}, current_timestamp())
+        """)
+    finally:
+        spark.conf.unset("spark.databricks.delta.write.txnAppId")
+        spark.conf.unset("spark.databricks.delta.write.txnVersion")
+
+
+def start_order_sketch_stream(spark, source_table: str, state_table: str, checkpoint_location: str,
+                              relative_error: float = 0.02):
+    """
+    Leer incrementalmente `source_table` (p. ej. silver.orders_clean) y
+    mantener un sketch de clientes únicos por día en `state_table`.
+    Devuelve el StreamingQuery; se ejecuta con trigger availableNow.
+    """
+    lg_config_k = lg_config_k_for_error(relative_error)
+    create_sketch_state_table(spark, state_table, lg_config_k)
+    # Un checkpoint nuevo reinicia batch_id en 0: con un appId por tabla Delta descartaría sus batches
+    app_id = f"order_sketches:{hashlib.sha256(checkpoint_location.encode()).hexdigest()[:16]}"
+    return (spark.readStream
+            .table(source_table)
+            .writeStream
+            .foreachBatch(lambda df, batch_id: merge_order_sketches(df, batch_id, state_table, lg_config_k, app_id))
+            .option("checkpointLocation", checkpoint_location)
+            .trigger(availableNow=True)
+            .start())
+
+
+def order_summary_from_sketches(spark, state_table: str, z: float = 2.0):
+    """
+    Resumen diario equivalente a gold.order_summary calculado desde los
+    sketches: estimación de clientes únicos y cota de error con `z`
+    desviaciones estándar (z=2 ≈ 95% de confianza).
+    """
+    rse = F.lit(1.04) / F.sqrt(F.pow(F.lit(2), F.col("lg_config_k")))
+    estimate = F.expr("hll_sketch_estimate(customer_sketch)")
+    return (spark.table(state_table)
+            .select(
+                "order_date",
+                "total_daily_orders",
+                estimate.alias("unique_customers"),
+                (rse * z).alias("relative_error"),
+                F.floor(estimate * (1 - rse * z)).alias("unique_customers_lower"),
+                F.ceil(estimate * (1 + rse * z)).alias("unique_customers_upper")
+            )
+            .orderBy("order_date"))
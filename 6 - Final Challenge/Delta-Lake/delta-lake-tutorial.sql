@@ -50,6 +50,20 @@ select count(*) from people_10
 
 -- COMMAND ----------
 
+-- MAGIC %md ## Profiling the upserts (optional)
+-- MAGIC - `enable_profiling` registers a query execution listener on this session. Every statement from here on records its duration, rows and bytes scanned, files read and pruned, shuffle and spill; `top_slowest` lists the slowest ones after the MERGE sections. Requires a classic (non-serverless) cluster.
+
+-- COMMAND ----------
+
+-- MAGIC %run ../../Includes/QueryProfiler
+
+-- COMMAND ----------
+
+-- MAGIC %python
+-- MAGIC enable_profiling(tag="delta-lake-tutorial")
+
+-- COMMAND ----------
+
 -- MAGIC %md ## Upsert to a Table
 -- MAGIC - To merge a set of updates and insertions into an existing Delta table, you use the [MERGE INTO](https://docs.databricks.com/en/sql/language-manual/delta-merge-into.html) statement
 
@@ -102,6 +116,40 @@ WHEN NOT MATCHED THEN INSERT ALL
 
 -- COMMAND ----------
 
+-- MAGIC %md ## Upsert with pruning and metrics
+-- MAGIC - `merge_with_metrics` deduplicates the source by key and adds the source key range to the `ON` clause (`t.id BETWEEN ...`), so Delta can skip target files whose statistics fall outside it.
+-- MAGIC - The `operationMetrics` of each MERGE (files rewritten, rows copied, execution time) are stored in `merge_benchmark`. Both runs apply the same `updates` to their own deep clone of the same `people_10m` version, so the pruned run can be compared with `prune=False` on identical data.
+
+-- COMMAND ----------
+
+-- MAGIC %run ../../Includes/MergeToolkit
+
+-- COMMAND ----------
+
+-- MAGIC %python
+-- MAGIC updates = spark.sql("SELECT id, firstName, middleName, lastName, gender, ssn, salary, try_cast(birthDate AS timestamp) AS birthDate FROM people_updates")
+-- MAGIC version = spark.sql("DESCRIBE HISTORY people_10m LIMIT 1").collect()[0]["version"]
+-- MAGIC for label in ("full", "pruned"):
+-- MAGIC     clone = f"people_10m_merge_{label}"
+-- MAGIC     spark.sql(f"CREATE OR REPLACE TABLE {clone} DEEP CLONE people_10m VERSION AS OF {version}")
+-- MAGIC     merge_with_metrics(updates, clone, ["id"], prune=label == "pruned", label=label)
+-- MAGIC     spark.sql(f"DROP TABLE {clone}")
+
+-- COMMAND ----------
+
+SELECT label, version, predicates, numTargetFilesRemoved, numTargetRowsCopied, executionTimeMs
+FROM merge_benchmark
+WHERE target_table LIKE 'people_10m_merge_%'
+ORDER BY recorded_at DESC
+
+-- COMMAND ----------
+
+-- MAGIC %python
+-- MAGIC display(top_slowest(10))
+-- MAGIC disable_profiling()
+
+-- COMMAND ----------
+
 -- MAGIC %md ## Read a table
 
 -- COMMAND ----------
@@ -114,6 +162,33 @@ describe detail people_10m
 
 -- COMMAND ----------
 
+-- MAGIC %md ## Fused updates and deletes
+-- MAGIC - The two `UPDATE`s and the `DELETE` below each rewrite the files they touch, creating three versions. `run_fused` compiles the same operations into a single `MERGE` of the table with itself on `id`, with a nested `CASE` per updated column. Each operation is compiled over the results of the previous ones (the second `UPDATE` sees `gender` already set by the first), so the result matches running them in order while the table is rewritten once.
+-- MAGIC - `benchmark_fused_vs_sequential` applies the operations to two deep clones of `people_10m`, one statement at a time and fused, and stores versions created, files rewritten and the time of the DML statements in `dml_benchmark`. The tutorial table is not modified.
+
+-- COMMAND ----------
+
+-- MAGIC %run ../../Includes/FusedDml
+
+-- COMMAND ----------
+
+-- MAGIC %python
+-- MAGIC operations = [
+-- MAGIC     {"op": "update", "set": {"gender": "'Female'"}, "where": "gender = 'F'"},
+-- MAGIC     {"op": "update", "set": {"gender": "'Male'"}, "where": "gender = 'M'"},
+-- MAGIC     {"op": "delete", "where": "birthDate < '1960-01-01'"},
+-- MAGIC ]
+-- MAGIC display(benchmark_fused_vs_sequential("people_10m", "id", operations))
+
+-- COMMAND ----------
+
+SELECT mode, versions, files_rewritten, seconds, final_rows
+FROM dml_benchmark
+WHERE target_table = 'people_10m'
+ORDER BY run_at DESC
+
+-- COMMAND ----------
+
 -- MAGIC %md ## Update a table
 
 -- COMMAND ----------
@@ -192,4 +267,24 @@ VACUUM TABLE people_10m
 
 -- COMMAND ----------
 
+-- MAGIC %md ## Maintenance driven by table statistics
+-- MAGIC - Instead of running OPTIMIZE / ZORDER / VACUUM by hand, `run_maintenance` reads `DESCRIBE DETAIL` and the Delta log (small files, file-size histogram, tombstone bytes) and only runs what is worth it within a time budget.
+-- MAGIC - The ZORDER columns are taken from the predicates in the table history and in the reference query, which is timed before and after.
+
+-- COMMAND ----------
+
+-- MAGIC %run ../../Includes/TableMaintenance
+
+-- COMMAND ----------
+
+-- MAGIC %python
+-- MAGIC report = run_maintenance(
+-- MAGIC     ["people_10m"],
+-- MAGIC     time_budget_seconds=300,
+-- MAGIC     reference_queries={"people_10m": "SELECT gender, count(*) FROM people_10m WHERE birthDate >= '1970-01-01' GROUP BY gender"}
+-- MAGIC )
+-- MAGIC display(report)
+
+-- COMMAND ----------
+
 
@@ -9,6 +9,18 @@
 
 # COMMAND ----------
 
+# MAGIC %md Optional: profile every Spark action in this notebook (duration, input rows/bytes, files, shuffle and spill). Requires a classic cluster.
+
+# COMMAND ----------
+
+# MAGIC %run ../../Includes/QueryProfiler
+
+# COMMAND ----------
+
+profiling = enable_profiling() is not None
+
+# COMMAND ----------
+
 import random
 
 # Create a sample DataFrame 'df1' with 100,000 rows
@@ -91,6 +103,12 @@ display(right_join_df)
 
 # COMMAND ----------
 
+# The slowest PySpark operations so far (joins and displays above)
+if profiling:
+    display(top_slowest(10))
+
+# COMMAND ----------
+
 # MAGIC %md # Now what if we want to use SQL
 
 # COMMAND ----------
@@ -245,4 +263,10 @@ display(inner_join_df)
 
 # COMMAND ----------
 
+# Save the remaining profile rows and remove the listener
+if profiling:
+    disable_profiling()
+
+# COMMAND ----------
+
 
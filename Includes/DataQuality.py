@@ -0,0 +1,165 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Motor de validación en una sola pasada
+# MAGIC
+# MAGIC Evalúa una lista de reglas sobre un DataFrame con **una sola agregación** y devuelve,
+# MAGIC por regla, el número de violaciones y algunas filas de ejemplo.
+# MAGIC
+# MAGIC Las reglas usan el mismo formato YAML de los checks de dqx (ver `3.3 - Multi-Hop Architecture`):
+# MAGIC
+# MAGIC ```yaml
+# MAGIC - criticality: error
+# MAGIC   check:
+# MAGIC     function: regex_match
+# MAGIC     arguments:
+# MAGIC       column: email
+# MAGIC       regex: '^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$'
+# MAGIC ```
+# MAGIC
+# MAGIC Funciones soportadas: `is_unique`, `regex_match`, `is_not_null`, `is_not_null_and_not_empty`,
+# MAGIC `is_in_range`, `sql_expression`, `is_not_in_future`.
+
+# COMMAND ----------
+
+from pyspark.sql import functions as F
+
+# COMMAND ----------
+
+def _rule_name(rule, index):
+    check = rule["check"]
+    args = check.get("arguments", {})
+    name = rule.get("name") or args.get("name")
+    if name:
+        return name
+    target = args.get("column") or "_".join(args.get("columns", [])) or str(index)
+    return f"{target}_{check['function']}"
+
+
+def _row_violation(check):
+    """
+    Condición booleana que marca una fila como inválida para un check de fila.
+    Los nulos solo cuentan como violación en is_not_null*.
+    """
+    function = check["function"]
+    args = check.get("arguments", {})
+    negate = args.get("negate", False)
+
+    if function == "is_not_null":
+        violation = F.col(args["column"]).isNull()
+    elif function == "is_not_null_and_not_empty":
+        column = F.col(args["column"])
+        violation = column.isNull() | (F.trim(column.cast("string")) == "")
+    elif function == "regex_match":
+        matches = F.col(args["column"]).rlike(args["regex"])
+        violation = matches if negate else ~matches
+    elif function == "is_in_range":
+        column = F.col(args["column"])
+        violation = (column < F.lit(args["min_limit"])) | (column > F.lit(args["max_limit"]))
+    elif function == "sql_expression":
+        expression = F.expr(args["expression"])
+        violation = expression if negate else ~expression
+    elif function == "is_not_in_future":
+        limit = F.current_timestamp() + F.expr(f"INTERVAL {int(args.get('offset', 0))} SECONDS")
+        violation = F.col(args["column"]).cast("timestamp") > limit
+    else:
+        raise Exception(f"Función de validación no soportada: {function}")
+    return F.coalesce(violation, F.lit(False))
+
+# COMMAND ----------
+
+def validate_checks(checks):
+    """
+    Verificar que cada regla tenga criticality y una función soportada
+    antes de ejecutar cualquier consulta.
+    """
+    supported = {"is_unique", "regex_match", "is_not_null", "is_not_null_and_not_empty",
+                 "is_in_range", "sql_expression", "is_not_in_future"}
+    errors = []
+    for i, rule in enumerate(checks):
+        if rule.get("criticality", "error") not in ("error", "warn"):
+            errors.append(f"Regla {i}: criticality debe ser 'error' o 'warn'")
+        function = rule.get("check", {}).get("function")
+        if function not in supported:
+            errors.append(f"Regla {i}: función no soportada '{function}'")
+    return errors
+
+
+def run_checks(df, checks, sample_size=5):
+    """
+    Evaluar todas las reglas en una sola agregación sobre `df`.
+
+    Devuelve una lista de diccionarios con: rule, function, criticality,
+    violations y samples (hasta `sample_size` filas inválidas; vacío para is_unique).
+    """
+    errors = validate_checks(checks)
+    if errors:
+        raise Exception("Reglas inválidas:\n" + "\n".join(errors))
+
+    row_struct = F.struct(*[F.col(c) for c in df.columns])
+    aggregations = [F.count(F.lit(1)).alias("_total")]
+    names = []
+    for i, rule in enumerate(checks):
+        check = rule["check"]
+        names.append(_rule_name(rule, i))
+        if check["function"] == "is_unique":
+            columns = check["arguments"]["columns"]
+            not_null = F.lit(True)
+            for c in columns:
+                not_null = not_null & F.col(c).isNotNull()
+            aggregations.append(
+                (F.count(F.when(not_null, 1)) - F.countDistinct(*[F.col(c) for c in columns])).alias(f"_v{i}")
+            )
+            continue
+
+        violation = _row_violation(check)
+        aggregations.append(F.count(F.when(violation, 1)).alias(f"_v{i}"))
+        # min_by con distintas semillas de hash elige filas inválidas sin acumular listas completas
+        samples = [
+            F.min_by(F.when(violation, row_struct), F.when(violation, F.xxhash64(F.lit(seed), row_struct)))
+            for seed in range(sample_size)
+        ]
+        aggregations.append(F.array_distinct(F.array_compact(F.array(*samples, F.lit(None)))).alias(f"_s{i}"))
+
+    result = df.agg(*aggregations).collect()[0]
+
+    report = []
+    for i, rule in enumerate(checks):
+        samples = [] if rule["check"]["function"] == "is_unique" else result[f"_s{i}"]
+        report.append({
+            "rule": names[i],
+            "function": rule["check"]["function"],
+            "criticality": rule.get("criticality", "error"),
+            "violations": int(result[f"_v{i}"]),
+            "samples": [s.asDict(recursive=True) for s in (samples or [])],
+            "total_rows": int(result["_total"])
+        })
+    return report
+
+# COMMAND ----------
+
+def report_to_df(report):
+    """
+    Convertir el reporte de run_checks en un DataFrame para display().
+    """
+    return spark.createDataFrame([
+        (r["rule"], r["function"], r["criticality"], r["violations"], r["total_rows"], str(r["samples"]))
+        for r in report
+    ], "rule string, function string, criticality string, violations long, total_rows long, samples string")
+
+
+def raise_on_errors(report):
+    """
+    Lanzar una excepción si alguna regla con criticality 'error' tiene violaciones.
+    Las reglas 'warn' solo se imprimen.
+    """
+    failed = []
+    for r in report:
+        if r["violations"] == 0:
+            continue
+        message = f"{r['rule']} ({r['function']}): {r['violations']} de {r['total_rows']} filas"
+        if r["criticality"] == "error":
+            failed.append(message)
+        else:
+            print(f"[WARN] {message}")
+    if failed:
+        raise Exception("Validación fallida:\n" + "\n".join(failed))
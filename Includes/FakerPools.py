@@ -0,0 +1,123 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Pools de valores Faker
+# MAGIC
+# MAGIC Llamar a Faker por fila (`fake.name()`, `fake.email()`, `fake.city()`...) cuesta decenas de microsegundos
+# MAGIC por valor. Aquí se generan una sola vez pools de unos miles de valores por locale, se guardan en un archivo
+# MAGIC local y las filas se arman muestreando índices con NumPy.
+# MAGIC
+# MAGIC ```python
+# MAGIC %run ../Includes/FakerPools
+# MAGIC
+# MAGIC pools = load_pools("es_ES")
+# MAGIC rng = np.random.default_rng(42)
+# MAGIC nombres = sample(pools, "name", 1_000_000, rng)
+# MAGIC ```
+
+# COMMAND ----------
+
+import json
+import os
+import tempfile
+import numpy as np
+from datetime import date, timedelta
+from faker import Faker
+
+# Cambiar la versión invalida los pools guardados en disco
+POOLS_VERSION = 1
+
+# Campo del pool -> método de Faker que lo genera
+POOL_FIELDS = {
+    "name": "name",
+    "first_name": "first_name",
+    "last_name": "last_name",
+    "email": "email",
+    "phone_number": "phone_number",
+    "city": "city",
+    "country": "country",
+    "street_name": "street_name",
+    "street_address": "street_address",
+    "address": "address",
+    "company": "company",
+    "word": "word",
+}
+
+POOLS_DIR = os.environ.get("FAKER_POOLS_DIR", os.path.join(tempfile.gettempdir(), "faker_pools"))
+
+_pools_cache = {}
+
+# COMMAND ----------
+
+def build_pools(locale="es_ES", size=5000, seed=0):
+    """
+    Generar `size` valores por campo con Faker. Es la única parte que llama a Faker.
+    """
+    fake = Faker(locale)
+    fake.seed_instance(seed)
+    return {field: np.array([getattr(fake, method)() for _ in range(size)])
+            for field, method in POOL_FIELDS.items()}
+
+
+def load_pools(locale="es_ES", size=5000, seed=0):
+    """
+    Devolver los pools de `locale`, en este orden: caché en memoria,
+    archivo local en POOLS_DIR o generándolos y guardándolos.
+    """
+    key = (locale, size, seed)
+    if key in _pools_cache:
+        return _pools_cache[key]
+
+    path = os.path.join(POOLS_DIR, f"{locale}_{size}_{seed}_v{POOLS_VERSION}.json")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            pools = {field: np.array(values) for field, values in json.load(f).items()}
+    else:
+        pools = build_pools(locale, size, seed)
+        os.makedirs(POOLS_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({field: values.tolist() for field, values in pools.items()}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    _pools_cache[key] = pools
+    return pools
+
+
+def sample(pools, field, n, rng):
+    """
+    Tomar `n` valores de un pool con índices aleatorios de NumPy.
+    """
+    values = pools[field]
+    return values[rng.integers(0, len(values), n)]
+
+
+def sample_dates(rng, n, days, end=None):
+    """
+    `n` fechas ISO entre `days` días antes de `end` (hoy por defecto) y `end`,
+    como desfases aleatorios de NumPy en lugar de `fake.date_between`.
+    """
+    end = end or date.today()
+    return [(end - timedelta(days=int(d))).isoformat() for d in rng.integers(0, days + 1, n)]
+
+
+def sample_datetimes(rng, n, start, end):
+    """
+    `n` datetimes uniformes entre `start` y `end` (como `fake.date_time_between`).
+    """
+    seconds = rng.integers(0, int((end - start).total_seconds()) + 1, n)
+    return [start + timedelta(seconds=int(s)) for s in seconds]
+
+
+def sample_sentences(pools, n, words, rng):
+    """
+    `n` frases de `words` palabras del pool, sin punto final (como `fake.sentence`).
+    """
+    return [" ".join(row).capitalize() for row in sample(pools, "word", n * words, rng).reshape(n, words).tolist()]
+
+
+def sample_one(pools, field, rng):
+    """
+    Un solo valor del pool como str de Python (para generadores fila a fila).
+    """
+    values = pools[field]
+    return str(values[rng.integers(0, len(values))])
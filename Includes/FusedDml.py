@@ -0,0 +1,202 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Varias sentencias UPDATE / DELETE en una sola pasada
+# MAGIC
+# MAGIC Cada `UPDATE` o `DELETE` sobre una tabla Delta lee y reescribe por separado los archivos que toca: dos `UPDATE`
+# MAGIC y un `DELETE` sobre `people_10m` son tres reescrituras y tres versiones. `run_fused` compila la lista de
+# MAGIC operaciones en **un solo `MERGE`** de la tabla consigo misma por su clave.
+# MAGIC
+# MAGIC Las operaciones se compilan en orden: el `WHERE` y los valores de `SET` de cada una se escriben sobre las
+# MAGIC expresiones que dejaron las anteriores (un `CASE` anidado por columna), y una fila borrada ya no cumple los
+# MAGIC predicados siguientes. El resultado es el mismo que ejecutarlas una tras otra:
+# MAGIC
+# MAGIC ```sql
+# MAGIC MERGE INTO people_10m t
+# MAGIC USING (SELECT t.id AS _key FROM people_10m t WHERE ...) s
+# MAGIC ON t.id = s._key
+# MAGIC WHEN MATCHED AND (... birthDate < '1960-01-01' ...) THEN DELETE
+# MAGIC WHEN MATCHED THEN UPDATE SET gender =
+# MAGIC   CASE WHEN coalesce((CASE WHEN coalesce((t.gender = 'F'), false) THEN ('Female') ELSE t.gender END) = 'M', false)
+# MAGIC        THEN ('Male')
+# MAGIC        ELSE (CASE WHEN coalesce((t.gender = 'F'), false) THEN ('Female') ELSE t.gender END) END
+# MAGIC ```
+# MAGIC
+# MAGIC ```python
+# MAGIC %run ../Includes/FusedDml
+# MAGIC
+# MAGIC run_fused("people_10m", "id", [
+# MAGIC     {"op": "update", "set": {"gender": "'Female'"}, "where": "gender = 'F'"},
+# MAGIC     {"op": "update", "set": {"gender": "'Male'"}, "where": "gender = 'M'"},
+# MAGIC     {"op": "delete", "where": "birthDate < '1960-01-01'"},
+# MAGIC ])
+# MAGIC ```
+
+# COMMAND ----------
+
+import re
+import time
+from pyspark.sql import functions as F
+
+BENCHMARK_TABLE = "dml_benchmark"
+
+# Literales entre comillas, identificadores entre backticks o identificadores simples
+_TOKENS = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\")|`([^`]+)`|\b([A-Za-z_][A-Za-z0-9_]*)\b")
+
+# COMMAND ----------
+
+def _substitute(expression, current):
+    """
+    Reemplazar en `expression` cada columna por su expresión actual
+    (`current`: columna en minúsculas -> SQL). No toca literales, nombres
+    calificados (x.col) ni llamadas a funciones.
+    """
+    def replace(m):
+        if m.group(1):
+            return m.group(0)
+        name = (m.group(2) or m.group(3)).lower()
+        before = expression[:m.start()].rstrip()
+        after = expression[m.end():].lstrip()
+        if name not in current or before.endswith(".") or after.startswith("("):
+            return m.group(0)
+        return f"({current[name]})"
+    return _TOKENS.sub(replace, expression)
+
+
+def validate_operations(table, operations):
+    """
+    Verificar el tipo de cada operación y que las columnas de SET existan.
+    """
+    columns = {c.lower() for c in spark.table(table).columns}
+    for i, op in enumerate(operations):
+        if op["op"] not in ("update", "delete"):
+            raise Exception(f"Operación {i}: tipo no soportado {op['op']}")
+        if op["op"] == "update":
+            unknown = sorted(c for c in op["set"] if c.lower() not in columns)
+            if unknown:
+                raise Exception(f"Operación {i}: columnas inexistentes en SET {unknown}")
+
+
+def compile_fused(table, key, operations):
+    """
+    Texto del MERGE equivalente a aplicar `operations` en secuencia y de la
+    subconsulta origen, con una columna `_op<i>` por operación (filas que toca).
+    """
+    columns = spark.table(table).columns
+    current = {c.lower(): f"t.`{c}`" for c in columns}
+    names = {c.lower(): c for c in columns}
+    deleted, modified, conditions = "false", [], []
+
+    for op in operations:
+        # Cada predicado ve la fila como la dejaron las operaciones anteriores
+        condition = f"coalesce(({_substitute(op['where'], current)}), false)"
+        if deleted != "false":
+            condition = f"(NOT ({deleted}) AND {condition})"
+        conditions.append(condition)
+        if op["op"] == "delete":
+            deleted = condition if deleted == "false" else f"({deleted}) OR {condition}"
+            continue
+        # Los valores de un mismo SET leen la fila anterior a la operación, como en UPDATE
+        values = {c.lower(): _substitute(v, current) for c, v in op["set"].items()}
+        for column, value in values.items():
+            current[column] = f"CASE WHEN {condition} THEN ({value}) ELSE {current[column]} END"
+            if column not in modified:
+                modified.append(column)
+
+    flags = ", ".join(f"{c} AS _op{i}" for i, c in enumerate(conditions))
+    any_match = " OR ".join(conditions)
+    source = f"SELECT t.`{key}` AS _key, {flags} FROM {table} t WHERE {any_match}"
+
+    clauses = []
+    if deleted != "false":
+        clauses.append(f"WHEN MATCHED AND ({deleted}) THEN DELETE")
+    if modified:
+        sets = ", ".join(f"`{names[c]}` = {current[c]}" for c in modified)
+        clauses.append(f"WHEN MATCHED THEN UPDATE SET {sets}")
+
+    merge = f"MERGE INTO {table} t USING ({source}) s ON t.`{key}` = s._key {' '.join(clauses)}"
+    return merge, source
+
+
+def run_fused(table, key, operations, count_rows=True):
+    """
+    Ejecutar `operations` en un solo MERGE. `key` debe identificar cada fila.
+    Devuelve métricas del commit y, con `count_rows`, las filas que toca cada
+    operación (una lectura extra de la tabla, fuera del tiempo medido).
+    """
+    validate_operations(table, operations)
+    merge, source = compile_fused(table, key, operations)
+
+    counts = None
+    if count_rows:
+        counts = spark.sql(source).agg(
+            *[F.sum(F.col(f"_op{i}").cast("long")).alias(f"op{i}") for i in range(len(operations))]
+        ).collect()[0]
+    start = time.time()
+    spark.sql(merge)
+    seconds = time.time() - start
+
+    last = spark.sql(f"DESCRIBE HISTORY {table} LIMIT 1").collect()[0]
+    metrics = last["operationMetrics"] or {}
+    report = {
+        "version": last["version"],
+        "seconds": round(seconds, 2),
+        "files_removed": int(metrics.get("numTargetFilesRemoved", 0)),
+        "files_added": int(metrics.get("numTargetFilesAdded", 0)),
+        "rows_updated": int(metrics.get("numTargetRowsUpdated", 0)),
+        "rows_deleted": int(metrics.get("numTargetRowsDeleted", 0)),
+        "operations": [{"op": op["op"], "where": op["where"], "rows": int(counts[f"op{i}"] or 0) if counts else None}
+                       for i, op in enumerate(operations)],
+    }
+    if counts:
+        for o in report["operations"]:
+            print(f"[INFO] {o['op']} WHERE {o['where']}: {o['rows']} filas")
+    print(f"[INFO] {table} v{report['version']}: {report['rows_updated']} filas actualizadas, "
+          f"{report['rows_deleted']} borradas, {report['files_removed']} archivos reescritos en {report['seconds']}s")
+    return report
+
+# COMMAND ----------
+
+def _sequential(table, operations):
+    for op in operations:
+        if op["op"] == "update":
+            sets = ", ".join(f"`{c}` = {v}" for c, v in op["set"].items())
+            spark.sql(f"UPDATE {table} SET {sets} WHERE {op['where']}")
+        else:
+            spark.sql(f"DELETE FROM {table} WHERE {op['where']}")
+
+
+def _rewrite_stats(table, since_version):
+    history = spark.sql(f"DESCRIBE HISTORY {table}").filter(F.col("version") > since_version).collect()
+    removed = sum(int((h["operationMetrics"] or {}).get("numRemovedFiles")
+                      or (h["operationMetrics"] or {}).get("numTargetFilesRemoved") or 0) for h in history)
+    return len(history), removed
+
+
+def benchmark_fused_vs_sequential(table, key, operations, results_table=BENCHMARK_TABLE):
+    """
+    Clonar `table` dos veces y aplicar `operations` en secuencia en una copia
+    y fusionadas en la otra. Guarda versiones creadas, archivos reescritos y segundos.
+    """
+    validate_operations(table, operations)
+    results = []
+    for mode in ("sequential", "fused"):
+        clone = f"{table}_dml_{mode}"
+        spark.sql(f"CREATE OR REPLACE TABLE {clone} DEEP CLONE {table}")
+        since = spark.sql(f"DESCRIBE HISTORY {clone} LIMIT 1").collect()[0]["version"]
+        start = time.time()
+        if mode == "sequential":
+            _sequential(clone, operations)
+        else:
+            # Sin el conteo por operación: solo se mide el MERGE
+            run_fused(clone, key, operations, count_rows=False)
+        seconds = time.time() - start
+        versions, removed = _rewrite_stats(clone, since)
+        results.append((table, mode, len(operations), versions, removed, round(seconds, 2),
+                        spark.table(clone).count()))
+        spark.sql(f"DROP TABLE {clone}")
+
+    df = (spark.createDataFrame(results, "target_table string, mode string, operations long, versions long, "
+                                         "files_rewritten long, seconds double, final_rows long")
+          .withColumn("run_at", F.current_timestamp()))
+    df.write.mode("append").saveAsTable(results_table)
+    return df
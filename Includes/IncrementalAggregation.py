@@ -0,0 +1,147 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Agregaciones en streaming con MERGE de las claves cambiadas
+# MAGIC
+# MAGIC Con `outputMode("complete")` cada disparo reescribe la tabla de resultados completa: el costo crece con el
+# MAGIC número de claves (autores), no con los datos nuevos. Con `outputMode("update")` cada micro-lote trae solo las
+# MAGIC claves cuyo agregado cambió, con su valor acumulado tomado del state store, y `foreachBatch` las aplica con `MERGE`.
+# MAGIC
+# MAGIC Como las filas traen el valor total (no un delta), repetir el `MERGE` de un lote reintentado deja el mismo resultado.
+# MAGIC
+# MAGIC ```python
+# MAGIC %run ../Includes/IncrementalAggregation
+# MAGIC
+# MAGIC query = start_incremental_aggregation(spark.table("author_counts_tmp_vw"), "author_counts", ["author"], checkpoint)
+# MAGIC display(state_metrics(query))
+# MAGIC ```
+
+# COMMAND ----------
+
+import json
+import time
+from delta.tables import DeltaTable
+from pyspark.sql import functions as F
+
+BENCHMARK_TABLE = "streaming_agg_benchmark"
+
+# COMMAND ----------
+
+def _as_dict(progress):
+    # PySpark < 4.0 devuelve diccionarios; desde 4.0 objetos StreamingQueryProgress
+    return progress if isinstance(progress, dict) else json.loads(progress.json)
+
+
+def merge_changed_keys(batch_df, batch_id, target_table, keys):
+    """
+    MERGE de las claves que cambiaron en el micro-lote. Crea la tabla si no existe.
+    """
+    spark_session = batch_df.sparkSession
+    if not spark_session.catalog.tableExists(target_table):
+        batch_df.write.format("delta").saveAsTable(target_table)
+        return
+    condition = " AND ".join(f"t.`{k}` = s.`{k}`" for k in keys)
+    (DeltaTable.forName(spark_session, target_table).alias("t")
+        .merge(batch_df.alias("s"), condition)
+        .whenMatchedUpdateAll()
+        .whenNotMatchedInsertAll()
+        .execute())
+
+
+def start_incremental_aggregation(agg_df, target_table, keys, checkpoint_location, available_now=True):
+    """
+    Escribir la agregación en streaming `agg_df` en `target_table` con
+    outputMode update y MERGE por `keys`. Devuelve la StreamingQuery.
+    """
+    writer = (agg_df.writeStream
+              .outputMode("update")
+              .foreachBatch(lambda df, batch_id: merge_changed_keys(df, batch_id, target_table, keys))
+              .option("checkpointLocation", checkpoint_location))
+    if available_now:
+        writer = writer.trigger(availableNow=True)
+    return writer.start()
+
+
+def state_metrics(query):
+    """
+    Métricas del state store por disparo: filas de entrada, claves totales,
+    claves actualizadas (filas escritas en modo update) y memoria usada.
+    """
+    rows = []
+    for p in map(_as_dict, query.recentProgress):
+        for op in p.get("stateOperators") or []:
+            rows.append({
+                "batch_id": p["batchId"],
+                "input_rows": p["numInputRows"],
+                "state_rows_total": op.get("numRowsTotal"),
+                "state_rows_updated": op.get("numRowsUpdated"),
+                "state_memory_bytes": op.get("memoryUsedBytes"),
+                "batch_ms": p["durationMs"].get("triggerExecution"),
+            })
+    return spark.createDataFrame(rows, "batch_id long, input_rows long, state_rows_total long, "
+                                       "state_rows_updated long, state_memory_bytes long, batch_ms long")
+
+# COMMAND ----------
+
+def _timed_run(query):
+    """
+    Esperar una consulta availableNow y devolver (progresos con datos, segundos).
+    """
+    start = time.time()
+    query.awaitTermination()
+    return [p for p in map(_as_dict, query.recentProgress) if p["numInputRows"] > 0], time.time() - start
+
+
+def benchmark_complete_vs_incremental(checkpoint_base, steps=5, rows_per_step=1000, n_authors=2000,
+                                      prefix="agg_bench", results_table=BENCHMARK_TABLE):
+    """
+    Hacer crecer una tabla de libros en `steps` pasos y, tras cada uno, ejecutar
+    el mismo conteo por autor en modo complete y en modo update + MERGE.
+    Guarda por paso y modo las filas escritas y la duración del disparo, y
+    comprueba al final que ambos modos dan los mismos conteos.
+    """
+    source, complete_table, incremental_table = f"{prefix}_books", f"{prefix}_complete", f"{prefix}_incremental"
+    for t in (source, complete_table, incremental_table):
+        spark.sql(f"DROP TABLE IF EXISTS {t}")
+    dbutils.fs.rm(checkpoint_base, True)
+
+    results = []
+    for step in range(steps):
+        # Los autores se repiten cada n_authors libros: desde que se completa la primera vuelta,
+        # cada paso actualiza autores que ya existen y el total de claves deja de crecer
+        (spark.range(step * rows_per_step, (step + 1) * rows_per_step)
+            .select(F.concat(F.lit("B"), F.col("id").cast("string")).alias("book_id"),
+                    F.concat(F.lit("Author "), (F.col("id") % n_authors).cast("string")).alias("author"))
+            .write.format("delta").mode("append").saveAsTable(source))
+
+        agg_df = spark.readStream.table(source).groupBy("author").agg(F.count("book_id").alias("total_books"))
+
+        complete, complete_seconds = _timed_run(
+            agg_df.writeStream.outputMode("complete")
+            .option("checkpointLocation", f"{checkpoint_base}/complete")
+            .trigger(availableNow=True)
+            .toTable(complete_table))
+        incremental, incremental_seconds = _timed_run(
+            start_incremental_aggregation(agg_df, incremental_table, ["author"], f"{checkpoint_base}/incremental"))
+
+        for mode, progress, seconds, written in (
+                ("complete", complete, complete_seconds, "numRowsTotal"),
+                ("incremental", incremental, incremental_seconds, "numRowsUpdated")):
+            ops = [op for p in progress for op in p.get("stateOperators") or []]
+            results.append({
+                "step": step,
+                "mode": mode,
+                "source_rows": (step + 1) * rows_per_step,
+                "authors": ops[-1].get("numRowsTotal") if ops else None,
+                "rows_written": sum(op.get(written) or 0 for op in ops),
+                "seconds": round(seconds, 2),
+            })
+
+    complete_df, incremental_df = spark.table(complete_table), spark.table(incremental_table)
+    if not (complete_df.exceptAll(incremental_df).isEmpty() and incremental_df.exceptAll(complete_df).isEmpty()):
+        raise Exception(f"{incremental_table} no coincide con {complete_table}: el MERGE de claves cambiadas perdió conteos")
+
+    df = (spark.createDataFrame(results, "step long, mode string, source_rows long, authors long, "
+                                         "rows_written long, seconds double")
+          .withColumn("run_at", F.current_timestamp()))
+    df.write.mode("append").saveAsTable(results_table)
+    return df
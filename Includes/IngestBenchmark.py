@@ -0,0 +1,165 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Benchmark de ingesta con Auto Loader
+# MAGIC
+# MAGIC Mide cómo escala la ingesta según **cantidad de archivos × tamaño × formato**:
+# MAGIC
+# MAGIC 1. `prepare_landing` genera una carpeta con exactamente `file_count` archivos de `rows_per_file` filas
+# MAGIC 2. `run_ingestion` la lee con `trigger(availableNow=True)` y resume el `StreamingQueryProgress` de cada lote
+# MAGIC    (`inputRowsPerSecond`, `processedRowsPerSecond`, duración de lote y de listado)
+# MAGIC 3. `run_benchmark` recorre todas las combinaciones y agrega los resultados a una tabla para comparar ejecuciones
+# MAGIC
+# MAGIC Con `backend="files"` se usa el file source de Spark (`readStream.format("parquet")`), así el benchmark corre
+# MAGIC también en un Spark local sin Auto Loader. Fuera de Databricks los resultados se guardan en el formato
+# MAGIC por defecto de la sesión.
+# MAGIC
+# MAGIC ```python
+# MAGIC %run ../Includes/IngestBenchmark
+# MAGIC
+# MAGIC run_benchmark(f"{volume_path}/benchmark", file_counts=[10, 100], rows_per_file=[1000, 100000], formats=["parquet", "json"])
+# MAGIC ```
+
+# COMMAND ----------
+
+import itertools
+import json
+import os
+import time
+import uuid
+from pyspark.sql import functions as F
+
+BENCHMARK_SCHEMA = "order_id long, customer_id string, quantity int, total double, order_timestamp long"
+
+RESULTS_TABLE = "ingest_benchmark_results"
+
+RESULTS_SCHEMA = """
+    run_id string, backend string, format string, file_count long, rows_per_file long, total_bytes long,
+    batches long, rows long, wall_seconds double, rows_per_second double, avg_input_rows_per_second double,
+    avg_processed_rows_per_second double, avg_batch_ms double, max_batch_ms long, total_listing_ms long
+"""
+
+# COMMAND ----------
+
+def _dir_stats(path):
+    """
+    Número de archivos de datos y bytes totales de `path`. Usa dbutils en
+    Databricks y el sistema de archivos local fuera de él.
+    """
+    try:
+        files = [(f.name, f.size) for f in dbutils.fs.ls(path) if not f.isDir()]
+    except NameError:
+        files = [(name, os.path.getsize(os.path.join(path, name))) for name in os.listdir(path)
+                 if os.path.isfile(os.path.join(path, name))]
+    files = [(name, size) for name, size in files if not name.startswith(("_", "."))]
+    return len(files), sum(size for _, size in files)
+
+
+def _remove(path):
+    try:
+        dbutils.fs.rm(path, True)
+    except NameError:
+        import shutil
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def prepare_landing(path, file_count, rows_per_file, file_format="parquet", seed=42):
+    """
+    Reemplazar `path` con `file_count` archivos de `rows_per_file` filas
+    con la forma de `orders`. Devuelve (archivos, bytes).
+    """
+    _remove(path)
+    total = file_count * rows_per_file
+    (spark.range(total, numPartitions=file_count)
+        .select(
+            F.col("id").alias("order_id"),
+            F.concat(F.lit("C"), F.lpad((F.rand(seed) * 100000).cast("int").cast("string"), 5, "0")).alias("customer_id"),
+            (F.rand(seed + 1) * 10 + 1).cast("int").alias("quantity"),
+            F.round(F.rand(seed + 2) * 100, 2).alias("total"),
+            (F.lit(1_700_000_000) + F.col("id")).alias("order_timestamp"))
+        .write.format(file_format).mode("overwrite").save(path))
+    return _dir_stats(path)
+
+# COMMAND ----------
+
+def _as_dict(progress):
+    # PySpark < 4.0 devuelve diccionarios; desde 4.0 objetos StreamingQueryProgress
+    return progress if isinstance(progress, dict) else json.loads(progress.json)
+
+
+def run_ingestion(source_dir, checkpoint_location, file_format="parquet", backend="cloudFiles",
+                  target_table=None, max_files_per_trigger=None):
+    """
+    Ingerir `source_dir` con availableNow y devolver las métricas agregadas.
+    Sin `target_table` el resultado se descarta con el sink `noop`, así solo se
+    mide la lectura.
+    """
+    _remove(checkpoint_location)
+    if backend == "cloudFiles":
+        reader = (spark.readStream.format("cloudFiles")
+                  .option("cloudFiles.format", file_format)
+                  .option("cloudFiles.schemaLocation", f"{checkpoint_location}/schema"))
+        if max_files_per_trigger:
+            reader = reader.option("cloudFiles.maxFilesPerTrigger", max_files_per_trigger)
+    elif backend == "files":
+        reader = spark.readStream.format(file_format)
+        if max_files_per_trigger:
+            reader = reader.option("maxFilesPerTrigger", max_files_per_trigger)
+    else:
+        raise Exception(f"Backend no soportado: {backend}")
+
+    writer = (reader.schema(BENCHMARK_SCHEMA).load(source_dir)
+              .writeStream
+              .option("checkpointLocation", checkpoint_location)
+              .trigger(availableNow=True))
+
+    start = time.time()
+    query = writer.toTable(target_table) if target_table else writer.format("noop").start()
+    query.awaitTermination()
+    wall_seconds = time.time() - start
+
+    batches = [_as_dict(p) for p in query.recentProgress if _as_dict(p)["numInputRows"] > 0]
+    durations = [b["durationMs"].get("triggerExecution", 0) for b in batches]
+    listing = [b["durationMs"].get("latestOffset", 0) for b in batches]
+    rows = sum(b["numInputRows"] for b in batches)
+
+    def avg(key):
+        values = [b[key] for b in batches if b.get(key) is not None]
+        return round(sum(values) / len(values), 1) if values else None
+
+    return {
+        "batches": len(batches),
+        "rows": rows,
+        "wall_seconds": round(wall_seconds, 2),
+        "rows_per_second": round(rows / wall_seconds, 1) if wall_seconds > 0 else None,
+        "avg_input_rows_per_second": avg("inputRowsPerSecond"),
+        "avg_processed_rows_per_second": avg("processedRowsPerSecond"),
+        "avg_batch_ms": round(sum(durations) / len(durations), 1) if durations else None,
+        "max_batch_ms": max(durations) if durations else None,
+        "total_listing_ms": sum(listing),
+    }
+
+# COMMAND ----------
+
+def run_benchmark(base_dir, file_counts=(10, 100), rows_per_file=(1000, 100000), formats=("parquet", "json"),
+                  backend="cloudFiles", results_table=RESULTS_TABLE, max_files_per_trigger=None):
+    """
+    Ejecutar todas las combinaciones archivos × filas × formato bajo `base_dir`
+    y agregar una fila por combinación a `results_table`.
+    """
+    run_id = str(uuid.uuid4())
+    results = []
+    for file_count, rows, file_format in itertools.product(file_counts, rows_per_file, formats):
+        case = f"{file_format}_{file_count}x{rows}"
+        files, size = prepare_landing(f"{base_dir}/landing/{case}", file_count, rows, file_format)
+        metrics = run_ingestion(f"{base_dir}/landing/{case}", f"{base_dir}/checkpoints/{case}",
+                                file_format, backend, max_files_per_trigger=max_files_per_trigger)
+        results.append({"run_id": run_id, "backend": backend, "format": file_format, "file_count": files,
+                        "rows_per_file": rows, "total_bytes": size, **metrics})
+        print(f"[INFO] {case}: {metrics['rows']} filas en {metrics['wall_seconds']}s "
+              f"({metrics['rows_per_second']} filas/s, {metrics['batches']} lotes)")
+
+    df = (spark.createDataFrame(results, RESULTS_SCHEMA)
+          .withColumn("spark_version", F.lit(spark.version))
+          .withColumn("run_at", F.current_timestamp()))
+    df.write.mode("append").option("mergeSchema", "true").saveAsTable(results_table)
+    return df
@@ -0,0 +1,140 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Extracción incremental por marca de agua
+# MAGIC
+# MAGIC `GenFarmaDB.load_incremental` marca cada fila de `invoice_header`/`invoice_details` con `_writetime`.
+# MAGIC En lugar de copiar la tabla completa en cada ejecución:
+# MAGIC
+# MAGIC 1. Se guarda por tabla la marca de agua (máximo `_writetime` ya copiado)
+# MAGIC 2. Se empuja `WHERE _writetime > marca - solapamiento` a la base de datos
+# MAGIC 3. Se hace `MERGE` por clave en la copia Delta, así releer el solapamiento no duplica filas
+# MAGIC
+# MAGIC ```python
+# MAGIC %run ../Includes/JdbcIncremental
+# MAGIC
+# MAGIC sync_table(jdbc_url, "invoice_header", properties, "demo.default.invoice_header", keys=["doc_id"])
+# MAGIC ```
+
+# COMMAND ----------
+
+# MAGIC %run ./JdbcReader
+
+# COMMAND ----------
+
+from datetime import timedelta
+from delta.tables import DeltaTable
+from pyspark.sql import functions as F
+from pyspark.sql.window import Window
+
+WATERMARK_TABLE = "jdbc_watermarks"
+
+# COMMAND ----------
+
+def _ensure_watermark_table(watermark_table):
+    spark.sql(f"""
+        CREATE TABLE IF NOT EXISTS {watermark_table} (
+          source_table STRING,
+          target_table STRING,
+          high_water_mark TIMESTAMP,
+          updated_at TIMESTAMP
+        )
+    """)
+
+
+def get_high_water_mark(source_table, target_table, watermark_table=WATERMARK_TABLE):
+    _ensure_watermark_table(watermark_table)
+    rows = (spark.table(watermark_table)
+            .filter((F.col("source_table") == source_table) & (F.col("target_table") == target_table))
+            .select("high_water_mark")
+            .collect())
+    return rows[0]["high_water_mark"] if rows else None
+
+
+def set_high_water_mark(source_table, target_table, high_water_mark, watermark_table=WATERMARK_TABLE):
+    _ensure_watermark_table(watermark_table)
+    (spark.createDataFrame([(source_table, target_table, high_water_mark)],
+                           "source_table string, target_table string, high_water_mark timestamp")
+        .withColumn("updated_at", F.current_timestamp())
+        .createOrReplaceTempView("_new_watermark"))
+    spark.sql(f"""
+        MERGE INTO {watermark_table} t
+        USING _new_watermark s
+        ON t.source_table = s.source_table AND t.target_table = s.target_table
+        WHEN MATCHED THEN UPDATE SET *
+        WHEN NOT MATCHED THEN INSERT *
+    """)
+
+# COMMAND ----------
+
+def merge_by_key(df, target_table, keys, order_column=None):
+    """
+    MERGE de `df` en `target_table` por `keys`. Si hay varias versiones de
+    la misma clave en el lote gana la de mayor `order_column`.
+    Crea la tabla destino si no existe.
+    """
+    if order_column:
+        df = (df.withColumn("_rn", F.row_number().over(
+                  Window.partitionBy(*keys).orderBy(F.col(order_column).desc())))
+              .filter("_rn = 1")
+              .drop("_rn"))
+    else:
+        df = df.dropDuplicates(keys)
+
+    if not spark.catalog.tableExists(target_table):
+        df.write.format("delta").saveAsTable(target_table)
+        return
+
+    condition = " AND ".join(f"t.`{k}` = s.`{k}`" for k in keys)
+    (DeltaTable.forName(spark, target_table).alias("t")
+        .merge(df.alias("s"), condition)
+        .whenMatchedUpdateAll()
+        .whenNotMatchedInsertAll()
+        .execute())
+
+
+def sync_table(jdbc_url, table, properties, target_table, keys, watermark_column="_writetime",
+               overlap=timedelta(minutes=5), watermark_table=WATERMARK_TABLE, full_refresh=False):
+    """
+    Copiar a Delta solo las filas nuevas de `table`.
+
+    Sin marca de agua previa (o con full_refresh) se lee la tabla completa.
+    Después solo se leen filas con `watermark_column` mayor que la marca menos
+    `overlap`, para no perder commits tardíos. Con watermark_column=None la
+    tabla se lee completa y se hace MERGE por clave.
+    """
+    hwm = None if full_refresh or watermark_column is None else \
+        get_high_water_mark(table, target_table, watermark_table)
+
+    source = table
+    if hwm is not None:
+        since = (hwm - overlap).strftime("%Y-%m-%d %H:%M:%S.%f")
+        source = f"(SELECT * FROM {table} WHERE {watermark_column} > '{since}') AS incremental_src"
+
+    df, plan = read_jdbc_table(jdbc_url, source, properties)
+    # El incremento se lee de la base una sola vez: la marca y el MERGE usan las mismas filas
+    stage = None
+    try:
+        df = df.persist()
+    except Exception:
+        # Serverless no admite persist: el incremento se guarda en una tabla Delta auxiliar
+        stage = f"{target_table}_jdbc_stage"
+        df.write.mode("overwrite").option("overwriteSchema", "true").saveAsTable(stage)
+        df = spark.table(stage)
+
+    try:
+        stats = df.agg(F.count(F.lit(1)).alias("rows"),
+                       (F.max(watermark_column) if watermark_column else F.lit(None)).alias("hwm")).collect()[0]
+        rows = stats["rows"]
+        if rows > 0:
+            merge_by_key(df, target_table, keys, watermark_column)
+            if watermark_column is not None:
+                set_high_water_mark(table, target_table, stats["hwm"], watermark_table)
+    finally:
+        if stage is None:
+            df.unpersist()
+        else:
+            spark.sql(f"DROP TABLE IF EXISTS {stage}")
+
+    mode = "completa" if hwm is None else f"incremental desde {hwm - overlap}"
+    print(f"[INFO] {table} -> {target_table}: {rows} filas leídas ({mode})")
+    return {"table": table, "target_table": target_table, "rows": rows, "high_water_mark": hwm}
@@ -0,0 +1,190 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Conversión de arreglos JSON a NDJSON / Parquet
+# MAGIC
+# MAGIC Un archivo con un arreglo JSON indentado (`[ {...}, {...} ]`) solo se puede leer con `multiLine=true`: cada
+# MAGIC archivo es **una sola tarea** que no se puede dividir y se carga completo en la memoria de un ejecutor.
+# MAGIC
+# MAGIC `convert_json_arrays` lee cada arreglo **elemento por elemento** (por bloques de `chunk_size`, sin cargar el
+# MAGIC documento) y escribe archivos NDJSON (un objeto por línea) o Parquet de `target_file_bytes` aproximados, que
+# MAGIC Spark sí puede dividir. Los archivos de entrada se convierten en paralelo, uno por proceso.
+# MAGIC
+# MAGIC En Parquet el esquema de cada parte se toma del primer grupo de `row_group_rows` filas. Si una fila posterior
+# MAGIC trae columnas nuevas o un tipo distinto (por ejemplo una columna siempre nula al inicio) la conversión falla con
+# MAGIC un error que indica la fila; para datos con esquema variable use `output_format="ndjson"`.
+# MAGIC
+# MAGIC ```python
+# MAGIC %run ../Includes/JsonArrayConverter
+# MAGIC
+# MAGIC convert_json_arrays(["transacciones.json"], f"{volume_path}/transacciones", output_format="parquet")
+# MAGIC ```
+
+# COMMAND ----------
+
+import json
+import os
+import time
+
+# Caracteres que pueden continuar un número JSON ("-3" de "-3.5e10")
+NUMBER_CHARS = set("0123456789+-.eE")
+from concurrent.futures import ProcessPoolExecutor
+
+# COMMAND ----------
+
+def _local_path(path):
+    # dbfs:/ se lee por el montaje /dbfs; /Volumes y rutas locales se usan tal cual
+    return "/dbfs/" + path[len("dbfs:/"):] if path.startswith("dbfs:/") else path
+
+
+def iter_json_array(path, chunk_size=1024 * 1024):
+    """
+    Generar los elementos de un arreglo JSON leyendo el archivo por bloques.
+    En memoria solo hay un bloque y el elemento que se está decodificando.
+    """
+    decoder = json.JSONDecoder()
+    with open(_local_path(path), encoding="utf-8") as f:
+        buf, pos, eof = "", 0, False
+
+        def more():
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf):
+                break
+            if eof:
+                return
+            more()
+        if buf[pos] != "[":
+            raise ValueError(f"{path} no empieza con un arreglo JSON")
+        pos += 1
+
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ","):
+                pos += 1
+            if pos >= len(buf):
+                if eof:
+                    raise ValueError(f"{path}: el arreglo JSON no está cerrado")
+                more()
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more()
+                continue
+            # Un número al final del bloque puede estar cortado ("12" de "125", "-3." de "-3.5e10")
+            if (not eof and isinstance(item, (int, float)) and not isinstance(item, bool)
+                    and (end == len(buf) or buf[end] in NUMBER_CHARS)):
+                more()
+                continue
+            yield item
+            pos = end
+            if pos > chunk_size:
+                buf, pos = buf[pos:], 0
+
+# COMMAND ----------
+
+def convert_file(path, output_dir, output_format="ndjson", target_file_bytes=128 * 1024 * 1024,
+                 row_group_rows=10000, chunk_size=1024 * 1024):
+    """
+    Convertir un archivo con un arreglo JSON en partes `<nombre>-part-NNNNN`
+    de `target_file_bytes` aproximados. Cada parte se escribe con un nombre
+    temporal (`_...`) y se renombra al terminar, así un lector nunca ve una parte a medias.
+    En Parquet falla si una fila no cabe en el esquema del primer grupo de filas de su parte.
+    """
+    if output_format not in ("ndjson", "parquet"):
+        raise ValueError(f"Formato de salida no soportado: {output_format}")
+    start = time.time()
+    out_dir = _local_path(output_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    extension = "json" if output_format == "ndjson" else "parquet"
+    state = {"part": 0, "bytes": 0, "handle": None, "writer": None, "rows": []}
+    parts, rows = [], 0
+
+    def part_paths():
+        name = f"{stem}-part-{state['part']:05d}.{extension}"
+        return os.path.join(out_dir, f"_{name}.tmp"), os.path.join(out_dir, name)
+
+    def write_row_group():
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if state["writer"] is None:
+            table = pa.Table.from_pylist(state["rows"])
+            state["writer"] = pq.ParquetWriter(part_paths()[0], table.schema)
+        else:
+            schema = state["writer"].schema
+            first_row = rows - len(state["rows"]) + 1
+            # from_pylist con schema descartaría en silencio las columnas que no están en el primer grupo
+            new_columns = sorted({k for r in state["rows"] for k in r} - set(schema.names))
+            try:
+                if new_columns:
+                    raise ValueError(f"columnas nuevas {new_columns}")
+                table = pa.Table.from_pylist(state["rows"], schema=schema)
+            except (ValueError, TypeError, pa.ArrowException) as e:
+                raise ValueError(f"{path}: las filas desde la {first_row} no coinciden con el esquema Parquet "
+                                 f"del primer grupo de filas ({e}). Use output_format='ndjson' o un row_group_rows "
+                                 f"mayor") from e
+        state["writer"].write_table(table)
+        state["rows"] = []
+
+    def close_part():
+        if output_format == "ndjson" and state["handle"] is not None:
+            state["handle"].close()
+        elif output_format == "parquet":
+            if state["rows"]:
+                write_row_group()
+            if state["writer"] is None:
+                return
+            state["writer"].close()
+        else:
+            return
+        tmp_path, final_path = part_paths()
+        os.replace(tmp_path, final_path)
+        parts.append(final_path)
+        state.update(part=state["part"] + 1, bytes=0, handle=None, writer=None)
+
+    for item in iter_json_array(path, chunk_size):
+        line = json.dumps(item, ensure_ascii=False)
+        rows += 1
+        if output_format == "ndjson":
+            if state["handle"] is None:
+                state["handle"] = open(part_paths()[0], "w", encoding="utf-8")
+            state["handle"].write(line + "\n")
+        else:
+            state["rows"].append(item)
+            if len(state["rows"]) >= row_group_rows:
+                write_row_group()
+        state["bytes"] += len(line) + 1
+        if state["bytes"] >= target_file_bytes:
+            close_part()
+    close_part()
+
+    return {"file": path, "rows": rows, "parts": len(parts), "seconds": round(time.time() - start, 2)}
+
+
+def convert_json_arrays(paths, output_dir, output_format="ndjson", target_file_bytes=128 * 1024 * 1024,
+                        max_workers=4):
+    """
+    Convertir `paths` (archivos o una carpeta con *.json) en paralelo, un
+    proceso por archivo. Devuelve el reporte de cada archivo.
+    """
+    if isinstance(paths, str):
+        folder = _local_path(paths)
+        paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.endswith(".json")]
+
+    with ProcessPoolExecutor(max_workers=max(1, min(max_workers, len(paths)))) as pool:
+        report = list(pool.map(convert_file, paths, [output_dir] * len(paths), [output_format] * len(paths),
+                               [target_file_bytes] * len(paths)))
+
+    for r in report:
+        print(f"[INFO] {r['file']}: {r['rows']} filas -> {r['parts']} archivos {output_format} en {r['seconds']}s")
+    return report
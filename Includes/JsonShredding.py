@@ -0,0 +1,123 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Triturado (shredding) de columnas JSON al escribir
+# MAGIC
+# MAGIC Guardar un JSON como `STRING` obliga a que **cada consulta** lo vuelva a parsear (`` `value`:user_id ``,
+# MAGIC `profile:address:country`, `from_json(...)`). Aquí el JSON se parsea **una sola vez** al escribir:
+# MAGIC
+# MAGIC - `flatten=True`: cada campo de primer nivel queda como columna tipada (`user_id INT`, `calories_burnt DOUBLE`, ...)
+# MAGIC - `flatten=False`: la columna pasa a ser un `STRUCT` con el mismo nombre (`profile.address.country`)
+# MAGIC
+# MAGIC El texto original se conserva en `<columna>_raw` para campos que no estén en el esquema, y `<columna>_parsed`
+# MAGIC indica si el JSON se pudo leer. Delta guarda cada campo en su propia columna Parquet, así una consulta que
+# MAGIC lee `profile.address.country` no lee ni parsea el resto.
+# MAGIC
+# MAGIC ```python
+# MAGIC %run ../Includes/JsonShredding
+# MAGIC
+# MAGIC write_shredded("customers", "value", "customers_shredded",
+# MAGIC                schema="user_id INT, calories_burnt DOUBLE, num_steps INT, miles_walked DOUBLE, time_stamp TIMESTAMP, device_id STRING")
+# MAGIC ```
+
+# COMMAND ----------
+
+import time
+from pyspark.sql import functions as F
+
+BENCHMARK_TABLE = "json_shredding_benchmark"
+
+# COMMAND ----------
+
+def infer_json_schema(df, column, sample_rows=1000):
+    """
+    Esquema DDL de la columna JSON `column` a partir de `sample_rows` filas.
+    """
+    sample = df.select(column).where(F.col(column).isNotNull()).limit(sample_rows)
+    try:
+        return sample.agg(F.expr(f"schema_of_json_agg(`{column}`)")).collect()[0][0]
+    except Exception:
+        # Runtimes sin schema_of_json_agg: esquema de la primera fila
+        first = sample.first()
+        if first is None:
+            raise Exception(f"La columna {column} no tiene valores para inferir el esquema")
+        return spark.range(1).select(F.schema_of_json(F.lit(first[0]))).collect()[0][0]
+
+
+def shred_json_column(df, column, schema, flatten=True, keep_raw=True):
+    """
+    Reemplazar la columna JSON `column` por sus campos tipados según `schema`
+    (DDL o StructType).
+    """
+    parsed = F.from_json(F.col(column), schema)
+    others = [F.col(c) for c in df.columns if c != column]
+    df = df.withColumn("_parsed", parsed)
+    names = df.select("_parsed.*").columns
+
+    # En modo PERMISSIVE un JSON mal formado da un struct con todos los campos nulos, no un nulo
+    any_field = F.lit(False)
+    for name in names:
+        any_field = any_field | F.col(f"_parsed.`{name}`").isNotNull()
+    extra = [F.col(column).alias(f"{column}_raw")] if keep_raw else []
+    extra.append((F.col(column).isNull() | any_field).alias(f"{column}_parsed"))
+
+    if flatten:
+        fields = [F.col(f"_parsed.`{name}`").alias(name) for name in names]
+        return df.select(*others, *fields, *extra)
+    return df.select(*others, F.col("_parsed").alias(column), *extra)
+
+
+def write_shredded(source_table, column, target_table, schema=None, flatten=True, keep_raw=True,
+                   mode="overwrite"):
+    """
+    Escribir `source_table` en `target_table` con la columna JSON ya parseada.
+    Si no se indica `schema` se infiere de una muestra. Devuelve el esquema usado.
+    """
+    df = spark.table(source_table)
+    schema = schema or infer_json_schema(df, column)
+    (shred_json_column(df, column, schema, flatten, keep_raw)
+        .write.format("delta").mode(mode).option("overwriteSchema", "true")
+        .saveAsTable(target_table))
+    failed = spark.table(target_table).filter(~F.col(f"{column}_parsed")).count()
+    print(f"[INFO] {source_table}.{column} -> {target_table} ({failed} filas no se pudieron parsear)")
+    return schema
+
+# COMMAND ----------
+
+def _timed(query, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.time()
+        spark.sql(query).write.format("noop").mode("overwrite").save()
+        times.append(time.time() - start)
+    return round(min(times), 3)
+
+
+def benchmark_shredding(raw_table, column, shredded_table, paths, schema, flatten=True, repeats=3,
+                        results_table=BENCHMARK_TABLE):
+    """
+    Comparar el tiempo de leer `paths` (por ejemplo ["user_id", "address:country"])
+    parseando en cada consulta (`:` y from_json) contra leer la tabla triturada.
+    Se guarda el mejor de `repeats` tiempos por variante.
+    """
+    if not isinstance(schema, str):
+        schema = schema.simpleString()
+
+    def shredded(path):
+        parts = path.split(":")
+        return ".".join(f"`{p}`" for p in (parts if flatten else [column] + parts))
+
+    queries = {
+        "path_extraction": f"SELECT {', '.join(f'`{column}`:{p}' for p in paths)} FROM {raw_table}",
+        "from_json": (f"SELECT {', '.join('j.' + '.'.join(p.split(':')) for p in paths)} "
+                      f"FROM (SELECT from_json(`{column}`, '{schema}') AS j FROM {raw_table})"),
+        "shredded": f"SELECT {', '.join(shredded(p) for p in paths)} FROM {shredded_table}",
+    }
+    results = [(raw_table, shredded_table, variant, _timed(q, repeats), q) for variant, q in queries.items()]
+    for _, _, variant, seconds, _ in results:
+        print(f"[INFO] {variant}: {seconds}s")
+
+    df = (spark.createDataFrame(results, "raw_table string, shredded_table string, variant string, "
+                                         "seconds double, query string")
+          .withColumn("run_at", F.current_timestamp()))
+    df.write.mode("append").saveAsTable(results_table)
+    return df
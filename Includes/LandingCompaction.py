@@ -0,0 +1,174 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Compactación de archivos pequeños en zonas de aterrizaje
+# MAGIC
+# MAGIC `GenDataStream.load_new_data` y las carpetas `*-raw` agregan un archivo pequeño por ejecución. Con el tiempo
+# MAGIC Auto Loader tiene que listar y abrir miles de archivos diminutos.
+# MAGIC
+# MAGIC `compact_landing`:
+# MAGIC
+# MAGIC 1. Toma solo archivos **ya ingeridos** (según `cloud_files_state` del checkpoint de Auto Loader) o, sin
+# MAGIC    checkpoint, archivos con más de `min_age_seconds`
+# MAGIC 2. Los agrupa hasta `target_file_bytes` y los reescribe como archivos grandes en `{archive_dir}/_staging/<run_id>`
+# MAGIC    (fuera de la carpeta que lee el stream, así nunca se reingieren)
+# MAGIC 3. Registra en `{archive_dir}/_manifest` qué archivos de origen consumió cada compactación y solo después
+# MAGIC    mueve las salidas a `{archive_dir}/compacted`. Una ejecución que falla antes del manifiesto no deja archivos
+# MAGIC    en `compacted`: la siguiente borra su `_staging` (o termina de mover las salidas si el manifiesto sí se escribió)
+# MAGIC 4. Opcionalmente elimina los originales de la zona de aterrizaje
+# MAGIC
+# MAGIC El reporte muestra cantidad de archivos y tiempo de listado antes y después.
+
+# COMMAND ----------
+
+import math
+import time
+from datetime import datetime, timezone
+from pyspark.sql import functions as F
+
+# COMMAND ----------
+
+def _normalize(path):
+    return path[len("dbfs:"):] if path.startswith("dbfs:") else path
+
+
+def _list_files(path):
+    start = time.time()
+    try:
+        files = [f for f in dbutils.fs.ls(path) if not f.isDir() and not f.name.startswith(("_", "."))]
+    except Exception as e:
+        if 'java.io.FileNotFoundException' not in str(e):
+            raise
+        files = []
+    return files, time.time() - start
+
+
+def _list_dirs(path):
+    try:
+        return [f for f in dbutils.fs.ls(path) if f.isDir()]
+    except Exception as e:
+        if 'java.io.FileNotFoundException' not in str(e):
+            raise
+        return []
+
+
+def ingested_files(checkpoint_location):
+    """
+    Rutas que el stream de Auto Loader con este checkpoint ya procesó.
+    """
+    rows = spark.sql(f"SELECT path FROM cloud_files_state('{checkpoint_location}')").collect()
+    return {_normalize(r["path"]) for r in rows}
+
+
+def _manifest_column(archive_dir, column):
+    manifest = f"{archive_dir}/_manifest"
+    try:
+        return {_normalize(r[column]) for r in spark.read.format("delta").load(manifest).select(column).collect()}
+    except Exception as e:
+        if "is not a Delta table" in str(e) or "PATH_NOT_FOUND" in str(e) or "doesn't exist" in str(e):
+            return set()
+        raise
+
+
+def consumed_files(archive_dir):
+    """
+    Rutas de origen que ya fueron compactadas en ejecuciones anteriores.
+    """
+    return _manifest_column(archive_dir, "source_path")
+
+
+def settle_staging(archive_dir):
+    """
+    Resolver las salidas que quedaron en `_staging` por una ejecución interrumpida:
+    se mueven a `compacted` si su manifiesto se escribió y se borran si no.
+    """
+    runs = _list_dirs(f"{archive_dir}/_staging")
+    if not runs:
+        return
+    committed = _manifest_column(archive_dir, "compacted_to")
+    for run in runs:
+        for part in _list_dirs(run.path):
+            output = f"{archive_dir}/compacted/{run.name.rstrip('/')}_{part.name.rstrip('/')}"
+            if _normalize(output) in committed:
+                dbutils.fs.mv(part.path, output, recurse=True)
+                print(f"[WARN] {output}: salida de una ejecución interrumpida movida desde _staging")
+            else:
+                print(f"[WARN] {part.path}: salida huérfana sin manifiesto, se elimina")
+        dbutils.fs.rm(run.path, recurse=True)
+
+
+def plan_bins(files, target_file_bytes):
+    """
+    Agrupar archivos en orden hasta llenar `target_file_bytes` por grupo.
+    """
+    bins, current, current_bytes = [], [], 0
+    for f in sorted(files, key=lambda f: f.path):
+        if current and current_bytes + f.size > target_file_bytes:
+            bins.append(current)
+            current, current_bytes = [], 0
+        current.append(f)
+        current_bytes += f.size
+    if current:
+        bins.append(current)
+    return bins
+
+# COMMAND ----------
+
+def compact_landing(source_dir, archive_dir, file_format="parquet", target_file_bytes=128 * 1024 * 1024,
+                    checkpoint_location=None, min_age_seconds=3600, remove_sources=False, min_files=2):
+    """
+    Compactar los archivos ya ingeridos de `source_dir` en `archive_dir`.
+    Devuelve un diccionario con archivos y tiempo de listado antes/después.
+    """
+    files_before, listing_before = _list_files(source_dir)
+    settle_staging(archive_dir)
+    done = consumed_files(archive_dir)
+
+    if checkpoint_location:
+        ready = ingested_files(checkpoint_location)
+        candidates = [f for f in files_before if _normalize(f.path) in ready]
+    else:
+        cutoff_ms = (time.time() - min_age_seconds) * 1000
+        candidates = [f for f in files_before if f.modificationTime <= cutoff_ms]
+    candidates = [f for f in candidates if _normalize(f.path) not in done]
+
+    compacted = []
+    if len(candidates) >= min_files:
+        run_id = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+        staging = f"{archive_dir}/_staging/{run_id}"
+        moves = []
+        for i, group in enumerate(plan_bins(candidates, target_file_bytes)):
+            staged = f"{staging}/{i:04d}"
+            output = f"{archive_dir}/compacted/{run_id}_{i:04d}"
+            group_bytes = sum(f.size for f in group)
+            (spark.read.format(file_format).load([f.path for f in group])
+                .repartition(max(1, math.ceil(group_bytes / target_file_bytes)))
+                .write.mode("errorifexists").format(file_format).save(staged))
+            compacted.extend((f.path, f.size, f.modificationTime, output) for f in group)
+            moves.append((staged, output))
+
+        # El manifiesto es el commit de la ejecución: se escribe antes de mover las salidas y de borrar los originales
+        (spark.createDataFrame(compacted, "source_path string, size long, modification_time long, compacted_to string")
+            .withColumn("compacted_at", F.current_timestamp())
+            .write.mode("append").format("delta").save(f"{archive_dir}/_manifest"))
+
+        for staged, output in moves:
+            dbutils.fs.mv(staged, output, recurse=True)
+        dbutils.fs.rm(staging, recurse=True)
+
+        if remove_sources:
+            for path, _, _, _ in compacted:
+                dbutils.fs.rm(path)
+
+    files_after, listing_after = _list_files(source_dir)
+    report = {
+        "source_dir": source_dir,
+        "files_compacted": len(compacted),
+        "files_before": len(files_before),
+        "files_after": len(files_after),
+        "listing_seconds_before": round(listing_before, 3),
+        "listing_seconds_after": round(listing_after, 3),
+    }
+    print(f"[INFO] {source_dir}: {report['files_before']} -> {report['files_after']} archivos "
+          f"({report['files_compacted']} compactados), listado {report['listing_seconds_before']}s -> "
+          f"{report['listing_seconds_after']}s")
+    return report
@@ -0,0 +1,136 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # MERGE con deduplicación, poda del destino y métricas
+# MAGIC
+# MAGIC `merge_with_metrics` ejecuta un `MERGE` por clave:
+# MAGIC
+# MAGIC 1. Deduplica el origen por clave (un `MERGE` falla si varias filas del origen coinciden con la misma fila destino)
+# MAGIC 2. Agrega al `ON` predicados de rango con los límites de las claves del origen (`t.id BETWEEN 9999998 AND 20000003`)
+# MAGIC    y, si una columna de partición es parte de la clave, `IN` con las particiones afectadas. Delta usa esos
+# MAGIC    predicados para descartar archivos por estadísticas y solo reescribe los que pueden tener coincidencias
+# MAGIC 3. Lee de `DESCRIBE HISTORY` las `operationMetrics` del commit (archivos reescritos, filas copiadas, tiempos)
+# MAGIC    y las guarda en `merge_benchmark`
+# MAGIC
+# MAGIC ```python
+# MAGIC %run ../Includes/MergeToolkit
+# MAGIC
+# MAGIC merge_with_metrics(spark.table("pais_update"), "pais", ["id"])
+# MAGIC ```
+
+# COMMAND ----------
+
+import datetime
+import uuid
+from pyspark.sql import functions as F
+from pyspark.sql.types import NumericType, DateType, TimestampType, StringType
+from pyspark.sql.window import Window
+
+BENCHMARK_TABLE = "merge_benchmark"
+
+# Métricas de MERGE que se guardan por ejecución
+MERGE_METRICS = [
+    "numSourceRows", "numTargetRowsUpdated", "numTargetRowsInserted", "numTargetRowsDeleted",
+    "numTargetRowsCopied", "numTargetFilesAdded", "numTargetFilesRemoved", "numTargetBytesAdded",
+    "numTargetBytesRemoved", "executionTimeMs", "scanTimeMs", "rewriteTimeMs",
+]
+
+# Máximo de valores de partición distintos para usar un predicado IN
+MAX_PARTITION_VALUES = 100
+
+# COMMAND ----------
+
+def dedup_source(df, keys, order_column=None):
+    """
+    Una fila por clave: la de mayor `order_column` o cualquiera si no se indica.
+    """
+    if order_column is None:
+        return df.dropDuplicates(keys)
+    return (df.withColumn("_rn", F.row_number().over(
+                Window.partitionBy(*keys).orderBy(F.col(order_column).desc())))
+            .filter("_rn = 1")
+            .drop("_rn"))
+
+
+def _sql_literal(value):
+    if isinstance(value, str):
+        return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+    if isinstance(value, datetime.datetime):
+        return f"TIMESTAMP'{value.isoformat(sep=' ')}'"
+    if isinstance(value, datetime.date):
+        return f"DATE'{value.isoformat()}'"
+    return str(value)
+
+
+def pruning_predicates(source_df, keys, target_table):
+    """
+    Predicados sobre el destino (alias `t`) derivados del origen: rango
+    BETWEEN por cada clave ordenable e IN sobre las columnas de partición
+    que son parte de la clave. Una partición que no es clave puede cambiar
+    en el origen: filtrarla en el ON dejaría sin coincidir la fila destino
+    y el INSERT duplicaría la clave.
+    """
+    target_types = {f.name: f.dataType for f in spark.table(target_table).schema.fields}
+    orderable = [k for k in keys
+                 if isinstance(target_types.get(k), (NumericType, DateType, TimestampType, StringType))]
+    partitions = [c for c in (spark.sql(f"DESCRIBE DETAIL {target_table}").collect()[0]["partitionColumns"] or [])
+                  if c in keys and c in source_df.columns]
+
+    aggs = [F.min(k).alias(f"min_{k}") for k in orderable] + [F.max(k).alias(f"max_{k}") for k in orderable]
+    aggs += [F.collect_set(c).alias(f"values_{c}") for c in partitions]
+    if not aggs:
+        return []
+    bounds = source_df.agg(*aggs).collect()[0]
+
+    predicates = []
+    for k in orderable:
+        lo, hi = bounds[f"min_{k}"], bounds[f"max_{k}"]
+        if lo is not None:
+            predicates.append(f"t.`{k}` BETWEEN {_sql_literal(lo)} AND {_sql_literal(hi)}")
+    for c in partitions:
+        values = bounds[f"values_{c}"]
+        if 0 < len(values) <= MAX_PARTITION_VALUES:
+            predicates.append(f"t.`{c}` IN ({', '.join(_sql_literal(v) for v in values)})")
+    return predicates
+
+# COMMAND ----------
+
+def merge_with_metrics(source_df, target_table, keys, order_column=None, prune=True, update=True, insert=True,
+                       label=None, benchmark_table=BENCHMARK_TABLE):
+    """
+    MERGE de `source_df` en `target_table` por `keys`. Devuelve un diccionario
+    con la versión creada, los predicados usados y las operationMetrics.
+    """
+    source_df = dedup_source(source_df, keys, order_column)
+    predicates = pruning_predicates(source_df, keys, target_table) if prune else []
+    condition = " AND ".join([f"t.`{k}` = s.`{k}`" for k in keys] + predicates)
+    clauses = (["WHEN MATCHED THEN UPDATE SET *"] if update else []) + \
+              (["WHEN NOT MATCHED THEN INSERT *"] if insert else [])
+
+    view = f"_merge_source_{uuid.uuid4().hex[:8]}"
+    source_df.createOrReplaceTempView(view)
+    try:
+        spark.sql(f"MERGE INTO {target_table} t USING {view} s ON {condition} {' '.join(clauses)}")
+    finally:
+        spark.catalog.dropTempView(view)
+
+    last = spark.sql(f"DESCRIBE HISTORY {target_table} LIMIT 1").collect()[0]
+    metrics = {m: int((last["operationMetrics"] or {}).get(m, 0)) for m in MERGE_METRICS}
+    result = {
+        "target_table": target_table,
+        "label": label or ("pruned" if predicates else "full"),
+        "version": last["version"],
+        "predicates": " AND ".join(predicates),
+        **metrics,
+    }
+
+    schema = ("target_table string, label string, version long, predicates string, " +
+              ", ".join(f"{m} long" for m in MERGE_METRICS))
+    (spark.createDataFrame([result], schema)
+        .withColumn("recorded_at", F.current_timestamp())
+        .write.mode("append").saveAsTable(benchmark_table))
+
+    print(f"[INFO] MERGE {target_table} v{result['version']}: "
+          f"{metrics['numTargetFilesRemoved']} archivos reescritos, {metrics['numTargetRowsCopied']} filas copiadas, "
+          f"{metrics['numTargetRowsUpdated']} actualizadas, {metrics['numTargetRowsInserted']} insertadas "
+          f"en {metrics['executionTimeMs']} ms")
+    return result
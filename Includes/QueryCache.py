@@ -0,0 +1,198 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Caché de resultados por versión de tabla
+# MAGIC
+# MAGIC Una consulta de dashboard que agrega tablas que no cambiaron vuelve a leerlas y agregarlas en cada refresco.
+# MAGIC `cached_sql` guarda el resultado en una tabla Delta y lo reutiliza mientras **la consulta y las versiones de
+# MAGIC las tablas que lee** sean las mismas:
+# MAGIC
+# MAGIC - La clave es el SQL normalizado (sin comentarios, espacios repetidos ni diferencias de mayúsculas fuera de
+# MAGIC   los literales) y la versión Delta actual de cada tabla de `FROM`/`JOIN` (`DESCRIBE HISTORY ... LIMIT 1`,
+# MAGIC   solo metadatos)
+# MAGIC - Si alguna versión cambió se vuelve a ejecutar y se reemplaza el resultado guardado
+# MAGIC - El índice `query_cache_index` guarda hasta `max_entries` consultas; al pasar el límite se eliminan las
+# MAGIC   usadas hace más tiempo (LRU) junto con su tabla de resultado
+# MAGIC - El resultado guarda la posición de cada fila (`_cache_row`) y se lee ordenado por ella, así se conserva el
+# MAGIC   `ORDER BY` de la consulta
+# MAGIC - Un acierto solo escribe `last_used_at` y `hits` en el índice. Acierto o fallo y duración de cada llamada se
+# MAGIC   acumulan en memoria y se agregan a `query_cache_metrics` en cada fallo, cada `METRICS_FLUSH_ROWS` llamadas o
+# MAGIC   con `flush_cache_metrics`/`cache_stats`
+# MAGIC
+# MAGIC ```python
+# MAGIC %run ../Includes/QueryCache
+# MAGIC
+# MAGIC display(cached_sql("SELECT anio, SUM(total_mount) AS total_mount FROM main.default.sales GROUP BY anio ORDER BY anio"))
+# MAGIC ```
+
+# COMMAND ----------
+
+import hashlib
+import json
+import re
+import time
+import uuid
+from pyspark.sql import functions as F
+
+INDEX_TABLE = "query_cache_index"
+METRICS_TABLE = "query_cache_metrics"
+RESULT_PREFIX = "query_cache_"
+MAX_ENTRIES = 50
+METRICS_FLUSH_ROWS = 50
+ROW_COLUMN = "_cache_row"
+
+_cache_metrics = globals().get("_cache_metrics", [])
+
+# COMMAND ----------
+
+def normalize_sql(query):
+    """
+    SQL sin comentarios ni `;` final, con espacios simples y en minúsculas
+    salvo los literales entre comillas.
+    """
+    query = re.sub(r"--[^\n]*|/\*.*?\*/", " ", query, flags=re.S)
+    parts = re.split(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\")", query)
+    parts = [p if i % 2 else re.sub(r"\s+", " ", p).lower() for i, p in enumerate(parts)]
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def referenced_tables(query):
+    """
+    Tablas que aparecen después de FROM o JOIN (sin subconsultas).
+    """
+    names = re.findall(r"\b(?:from|join)\s+([`\w.]+)", normalize_sql(query))
+    return sorted({n.replace("`", "") for n in names})
+
+
+def table_version(table):
+    try:
+        return spark.sql(f"DESCRIBE HISTORY {table} LIMIT 1").collect()[0]["version"]
+    except Exception:
+        # Vistas o tablas que no son Delta: no hay versión con la que validar
+        return None
+
+
+def _ensure_tables(index_table, metrics_table):
+    spark.sql(f"""
+        CREATE TABLE IF NOT EXISTS {index_table} (
+          sql_hash STRING, query STRING, versions STRING, result_table STRING, num_rows BIGINT,
+          hits BIGINT, created_at TIMESTAMP, last_used_at TIMESTAMP
+        )
+    """)
+    spark.sql(f"""
+        CREATE TABLE IF NOT EXISTS {metrics_table} (
+          sql_hash STRING, hit BOOLEAN, seconds DOUBLE, recorded_at TIMESTAMP
+        )
+    """)
+
+# COMMAND ----------
+
+def _upsert_entry(index_table, entry):
+    view = f"_query_cache_{uuid.uuid4().hex[:8]}"
+    (spark.createDataFrame([entry], "sql_hash string, query string, versions string, result_table string, "
+                                    "num_rows long, hits long")
+        .createOrReplaceTempView(view))
+    spark.sql(f"""
+        MERGE INTO {index_table} t USING {view} s ON t.sql_hash = s.sql_hash
+        WHEN MATCHED THEN UPDATE SET
+          versions = s.versions, num_rows = s.num_rows, created_at = current_timestamp(),
+          last_used_at = current_timestamp()
+        WHEN NOT MATCHED THEN INSERT
+          (sql_hash, query, versions, result_table, num_rows, hits, created_at, last_used_at)
+          VALUES (s.sql_hash, s.query, s.versions, s.result_table, s.num_rows, 0, current_timestamp(), current_timestamp())
+    """)
+    spark.catalog.dropTempView(view)
+
+
+def flush_cache_metrics(metrics_table=METRICS_TABLE):
+    """
+    Agregar a `metrics_table` las llamadas acumuladas desde el último flush.
+    """
+    rows = list(_cache_metrics)
+    del _cache_metrics[:]
+    if rows:
+        (spark.createDataFrame(rows, "sql_hash string, hit boolean, seconds double, recorded_at double")
+            .withColumn("recorded_at", F.col("recorded_at").cast("timestamp"))
+            .write.mode("append").saveAsTable(metrics_table))
+    return len(rows)
+
+
+def _read_result(result_table):
+    df = spark.table(result_table)
+    if ROW_COLUMN not in df.columns:
+        return df
+    return df.orderBy(ROW_COLUMN).drop(ROW_COLUMN)
+
+
+def evict(index_table=INDEX_TABLE, max_entries=MAX_ENTRIES):
+    """
+    Eliminar las entradas menos usadas recientemente por encima de `max_entries`.
+    """
+    stale = (spark.table(index_table)
+             .orderBy(F.col("last_used_at").desc())
+             .offset(max_entries)
+             .select("sql_hash", "result_table")
+             .collect())
+    for row in stale:
+        spark.sql(f"DROP TABLE IF EXISTS {row['result_table']}")
+    if stale:
+        hashes = ", ".join(f"'{row['sql_hash']}'" for row in stale)
+        spark.sql(f"DELETE FROM {index_table} WHERE sql_hash IN ({hashes})")
+        print(f"[INFO] {len(stale)} resultados eliminados de la caché")
+
+
+def cached_sql(query, tables=None, max_entries=MAX_ENTRIES, cache_schema=None,
+               index_table=INDEX_TABLE, metrics_table=METRICS_TABLE):
+    """
+    Resultado de `query` desde la caché si las tablas que lee (`tables` o las
+    de FROM/JOIN) siguen en la misma versión; si no, ejecutarla y guardarla.
+    """
+    start = time.time()
+    _ensure_tables(index_table, metrics_table)
+    normalized = normalize_sql(query)
+    sql_hash = hashlib.sha256(normalized.encode()).hexdigest()[:16]
+
+    versions = {t: table_version(t) for t in (tables or referenced_tables(query))}
+    if not versions or None in versions.values():
+        print(f"[WARN] Sin versión Delta para {[t for t, v in versions.items() if v is None]}, se ejecuta sin caché")
+        return spark.sql(query)
+    versions = json.dumps(versions, sort_keys=True)
+
+    entry = spark.table(index_table).filter(F.col("sql_hash") == sql_hash).first()
+    hit = (entry is not None and entry["versions"] == versions
+           and spark.catalog.tableExists(entry["result_table"]))
+    if hit:
+        result_table = entry["result_table"]
+        spark.sql(f"UPDATE {index_table} SET hits = hits + 1, last_used_at = current_timestamp() "
+                  f"WHERE sql_hash = '{sql_hash}'")
+    else:
+        result_table = f"{cache_schema + '.' if cache_schema else ''}{RESULT_PREFIX}{sql_hash}"
+        # Tras un ORDER BY los ids crecen en el orden de las filas; la tabla Delta no guarda ese orden
+        (spark.sql(query).withColumn(ROW_COLUMN, F.monotonically_increasing_id())
+            .write.mode("overwrite").option("overwriteSchema", "true").saveAsTable(result_table))
+        num_rows = int((spark.sql(f"DESCRIBE HISTORY {result_table} LIMIT 1").collect()[0]["operationMetrics"]
+                        or {}).get("numOutputRows", 0))
+        _upsert_entry(index_table, {"sql_hash": sql_hash, "query": normalized, "versions": versions,
+                                    "result_table": result_table, "num_rows": num_rows, "hits": 0})
+        evict(index_table, max_entries)
+
+    seconds = round(time.time() - start, 3)
+    _cache_metrics.append((sql_hash, hit, seconds, time.time()))
+    if not hit or len(_cache_metrics) >= METRICS_FLUSH_ROWS:
+        flush_cache_metrics(metrics_table)
+    print(f"[INFO] {'Acierto' if hit else 'Fallo'} de caché {sql_hash} ({versions}) en {seconds}s")
+    return _read_result(result_table)
+
+
+def cache_stats(metrics_table=METRICS_TABLE, index_table=INDEX_TABLE):
+    """
+    Aciertos, fallos, tasa de aciertos y tiempo medio por consulta.
+    """
+    flush_cache_metrics(metrics_table)
+    return (spark.table(metrics_table)
+            .groupBy("sql_hash")
+            .agg(F.sum(F.col("hit").cast("long")).alias("hits"),
+                 F.sum((~F.col("hit")).cast("long")).alias("misses"),
+                 F.round(F.avg(F.col("hit").cast("double")), 3).alias("hit_ratio"),
+                 F.round(F.avg(F.when(F.col("hit"), F.col("seconds"))), 3).alias("avg_hit_seconds"),
+                 F.round(F.avg(F.when(~F.col("hit"), F.col("seconds"))), 3).alias("avg_miss_seconds"))
+            .join(spark.table(index_table).select("sql_hash", "query", "last_used_at"), "sql_hash", "left"))
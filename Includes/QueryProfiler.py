@@ -0,0 +1,201 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Perfilado de consultas Spark SQL
+# MAGIC
+# MAGIC `enable_profiling` registra un `QueryExecutionListener` en la sesión. Por cada acción (`collect`, `display`,
+# MAGIC `saveAsTable`, `MERGE`, ...) toma las métricas SQL del plan ejecutado (incluidas las etapas de AQE):
+# MAGIC
+# MAGIC - duración, filas y bytes leídos por los scans
+# MAGIC - archivos leídos y podados
+# MAGIC - bytes de shuffle leídos y escritos, y bytes derramados a disco (spill)
+# MAGIC
+# MAGIC Las filas se acumulan en memoria y `flush_profile` las agrega a la tabla Delta `query_profile`, etiquetadas con
+# MAGIC el notebook o tarea del job y un `run_id` por llamada a `enable_profiling`. `top_slowest` muestra las
+# MAGIC operaciones más lentas de una ejecución.
+# MAGIC
+# MAGIC El listener usa la sesión JVM (Py4J): en serverless o clusters con Spark Connect no está disponible y
+# MAGIC `enable_profiling` solo avisa.
+# MAGIC
+# MAGIC ```python
+# MAGIC %run ../Includes/QueryProfiler
+# MAGIC
+# MAGIC enable_profiling()
+# MAGIC ...
+# MAGIC display(top_slowest(10))
+# MAGIC ```
+
+# COMMAND ----------
+
+import json
+import time
+import uuid
+from pyspark.sql import functions as F
+
+PROFILE_TABLE = "query_profile"
+
+# Métricas SQL que se suman por columna; cada operador reporta solo las suyas
+PROFILE_METRICS = {
+    "files_read": ["numFiles", "numFilesRead"],
+    "files_pruned": ["numFilesPruned", "numPrunedFiles"],
+    "input_bytes": ["filesSize", "sizeOfFilesRead"],
+    "shuffle_read_bytes": ["remoteBytesRead", "localBytesRead"],
+    "shuffle_write_bytes": ["shuffleBytesWritten"],
+    "spill_bytes": ["spillSize"],
+}
+
+PROFILE_SCHEMA = """run_id string, tag string, func string, status string, duration_ms double, input_rows long,
+                    input_bytes long, files_read long, files_pruned long, shuffle_read_bytes long,
+                    shuffle_write_bytes long, spill_bytes long, operators string, metrics string, error string,
+                    finished_at double"""
+
+_profiler = globals().get("_profiler", {"listener": None, "run_id": None, "tag": None, "rows": []})
+
+# COMMAND ----------
+
+def _context_tag():
+    # Tarea del job si corre en un job; si no, ruta del notebook
+    try:
+        ctx = dbutils.notebook.entry_point.getDbutils().notebook().getContext()
+        task = ctx.tags().get("taskKey")
+        if task.isDefined():
+            return task.get()
+        return ctx.notebookPath().get()
+    except Exception:
+        return None
+
+
+def _plan_nodes(plan):
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        yield node
+        cls = node.getClass().getSimpleName()
+        # Con AQE el plan final y cada etapa quedan dentro de nodos hoja
+        if cls == "AdaptiveSparkPlanExec":
+            stack.append(node.executedPlan())
+        elif cls.endswith("QueryStageExec"):
+            stack.append(node.plan())
+        children = node.children()
+        stack.extend(children.apply(i) for i in range(children.size()))
+
+
+def _collect_metrics(qe):
+    converters = spark.sparkContext._jvm.scala.collection.JavaConverters
+    totals, operators, input_rows = {}, [], 0
+    for node in _plan_nodes(qe.executedPlan()):
+        name = node.nodeName()
+        metrics = {k: v.value() for k, v in converters.mapAsJavaMapConverter(node.metrics()).asJava().items()}
+        if not metrics:
+            continue
+        operators.append(name)
+        if "Scan" in name:
+            input_rows += metrics.get("numOutputRows", 0)
+        for key, value in metrics.items():
+            totals[key] = totals.get(key, 0) + value
+    row = {column: sum(totals.get(m, 0) for m in names) for column, names in PROFILE_METRICS.items()}
+    row.update(input_rows=input_rows, operators=",".join(sorted(set(operators))), metrics=json.dumps(totals))
+    return row
+
+
+class _ProfilingListener:
+    def __init__(self, profile_table):
+        self.profile_table = profile_table
+
+    def _record(self, func, qe, duration_ns, error):
+        try:
+            # Las escrituras de flush_profile también disparan el listener
+            if self.profile_table in qe.logical().toString()[:2000]:
+                return
+            row = {"run_id": _profiler["run_id"], "tag": _profiler["tag"], "func": func,
+                   "status": "error" if error else "ok", "duration_ms": duration_ns / 1e6,
+                   "error": error, "finished_at": time.time()}
+            row.update(_collect_metrics(qe))
+            _profiler["rows"].append(row)
+        except Exception as e:
+            print(f"[WARN] No se pudieron leer las métricas de {func}: {e}")
+
+    def onSuccess(self, func, qe, duration_ns):
+        self._record(func, qe, duration_ns, None)
+
+    def onFailure(self, func, qe, exception):
+        self._record(func, qe, 0, str(exception.getMessage()))
+
+    class Java:
+        implements = ["org.apache.spark.sql.util.QueryExecutionListener"]
+
+# COMMAND ----------
+
+def enable_profiling(tag=None, profile_table=PROFILE_TABLE):
+    """
+    Registrar el listener en la sesión y empezar una ejecución nueva. Devuelve
+    el `run_id` o None si la sesión no expone la JVM.
+    """
+    if _profiler["listener"] is not None:
+        disable_profiling()
+    try:
+        from pyspark.java_gateway import ensure_callback_server_started
+        gateway = spark.sparkContext._gateway
+        ensure_callback_server_started(gateway)
+        listener = _ProfilingListener(profile_table)
+        spark._jsparkSession.listenerManager().register(listener)
+    except Exception as e:
+        print(f"[WARN] Perfilado no disponible en esta sesión: {e}")
+        return None
+    _profiler.update(listener=listener, run_id=uuid.uuid4().hex[:12], tag=tag or _context_tag(), rows=[])
+    print(f"[INFO] Perfilado activo, run_id={_profiler['run_id']} ({_profiler['tag']})")
+    return _profiler["run_id"]
+
+
+def flush_profile(profile_table=PROFILE_TABLE):
+    """
+    Agregar a `profile_table` las métricas acumuladas desde el último flush.
+    """
+    # El listener corre en otro hilo: dar tiempo a que lleguen los últimos eventos
+    time.sleep(1)
+    rows, _profiler["rows"] = _profiler["rows"], []
+    if rows:
+        (spark.createDataFrame(rows, PROFILE_SCHEMA)
+            .withColumn("finished_at", F.col("finished_at").cast("timestamp"))
+            .write.mode("append").saveAsTable(profile_table))
+    print(f"[INFO] {len(rows)} consultas guardadas en {profile_table}")
+    return len(rows)
+
+
+def disable_profiling(profile_table=PROFILE_TABLE):
+    if _profiler["listener"] is None:
+        return
+    flush_profile(profile_table)
+    spark._jsparkSession.listenerManager().unregister(_profiler["listener"])
+    _profiler["listener"] = None
+
+
+TOP_COLUMNS = ["tag", "func", "status", "duration_ms", "input_rows", "input_bytes", "files_read", "files_pruned",
+               "shuffle_read_bytes", "shuffle_write_bytes", "spill_bytes", "operators", "finished_at"]
+
+
+def top_slowest(n=10, run_id=None, profile_table=PROFILE_TABLE):
+    """
+    Las `n` operaciones más lentas de `run_id` (por defecto la ejecución actual
+    o la última guardada). Sin datos de perfilado devuelve un DataFrame vacío.
+    """
+    if _profiler["rows"]:
+        flush_profile(profile_table)
+    empty = (spark.createDataFrame([], PROFILE_SCHEMA)
+             .withColumn("finished_at", F.col("finished_at").cast("timestamp"))
+             .select(*TOP_COLUMNS))
+    if not spark.catalog.tableExists(profile_table):
+        print(f"[WARN] No existe {profile_table}: el perfilado no estuvo activo en esta sesión")
+        return empty
+    df = spark.table(profile_table)
+    if run_id is None:
+        run_id = _profiler["run_id"]
+    if run_id is None:
+        last = df.orderBy(F.col("finished_at").desc()).first()
+        if last is None:
+            print(f"[WARN] {profile_table} no tiene ejecuciones guardadas")
+            return empty
+        run_id = last["run_id"]
+    return (df.filter(F.col("run_id") == run_id)
+            .orderBy(F.col("duration_ms").desc())
+            .select(*TOP_COLUMNS)
+            .limit(n))
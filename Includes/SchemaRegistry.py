@@ -0,0 +1,268 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Registro de esquemas fijos
+# MAGIC
+# MAGIC Con `cloudFiles.schemaLocation`, `cloudFiles.inferColumnTypes` o `read_files(...)` sin esquema, Spark muestrea
+# MAGIC o recorre los archivos **antes** de mover un solo dato. En una recarga grande eso es un escaneo extra.
+# MAGIC
+# MAGIC Aquí se guardan los `StructType` de cada conjunto de datos del curso, versionados. Los lectores los pasan
+# MAGIC directamente:
+# MAGIC
+# MAGIC ```python
+# MAGIC %run ../Includes/SchemaRegistry
+# MAGIC
+# MAGIC spark.readStream.format("cloudFiles").option("cloudFiles.format", "parquet") \
+# MAGIC     .schema(get_schema("bookstore", "orders")).load(f"{volume_path}/orders")
+# MAGIC ```
+# MAGIC
+# MAGIC Para SQL (`read_files(..., schema => '...')`, `cloud_files(..., map("schema", "..."))`) usar `schema_ddl`.
+# MAGIC `validate_schema` lee solo unos pocos archivos y reporta columnas faltantes, nuevas o con otro tipo.
+# MAGIC
+# MAGIC | Conjunto | Origen |
+# MAGIC |--|--|
+# MAGIC | bookstore | `GenDataStream` (`orders`, `customers`, `books`) |
+# MAGIC | school | Labs, `Setup-Lab` (`enrollments`, `students`, `courses`) |
+# MAGIC | medallion | `GenMedallion` (`clientes`, `productos`, `ventas`) |
+# MAGIC | workshop | SDP Workshop, `0 - Setup` (`orders`, `status`, `customers`) |
+
+# COMMAND ----------
+
+from pyspark.sql.types import (
+    StructType, StructField, StringType, IntegerType, LongType, DoubleType, BooleanType, DateType, ArrayType,
+    ByteType, ShortType, FloatType, DecimalType
+)
+
+INTEGRAL_TYPES = (ByteType, ShortType, IntegerType, LongType)
+FRACTIONAL_TYPES = (FloatType, DoubleType, DecimalType)
+
+# (conjunto, tabla) -> {versión: StructType}. Para cambiar un esquema se agrega una versión nueva,
+# nunca se edita una existente: los lectores que fijaron una versión siguen funcionando igual.
+SCHEMAS = {
+    ("bookstore", "orders"): {
+        1: StructType([
+            StructField("order_id", StringType(), False),
+            StructField("order_date", StringType(), True),
+            StructField("customer_id", StringType(), True),
+            StructField("quantity", IntegerType(), True),
+            StructField("total", DoubleType(), True),
+            StructField("books", ArrayType(StringType()), True),
+        ]),
+    },
+    ("bookstore", "customers"): {
+        1: StructType([
+            StructField("customer_id", StringType(), False),
+            StructField("email", StringType(), True),
+            StructField("profile", StringType(), True),
+            StructField("updated", StringType(), True),
+        ]),
+    },
+    ("bookstore", "books"): {
+        1: StructType([
+            StructField("book_id", StringType(), False),
+            StructField("title", StringType(), True),
+            StructField("author", StringType(), True),
+            StructField("category", StringType(), True),
+            StructField("price", DoubleType(), True),
+        ]),
+    },
+    ("school", "enrollments"): {
+        1: StructType([
+            StructField("enroll_id", StringType(), True),
+            StructField("enroll_timestamp", LongType(), True),
+            StructField("student_id", StringType(), True),
+            StructField("quantity", LongType(), True),
+            StructField("total", DoubleType(), True),
+            StructField("courses", ArrayType(StructType([
+                StructField("course_id", StringType(), True),
+                StructField("quantity", LongType(), True),
+                StructField("subtotal", DoubleType(), True),
+            ])), True),
+        ]),
+    },
+    ("school", "students"): {
+        1: StructType([
+            StructField("student_id", StringType(), True),
+            StructField("email", StringType(), True),
+            StructField("gpa", DoubleType(), True),
+            StructField("profile", StringType(), True),
+            StructField("updated", StringType(), True),
+        ]),
+    },
+    ("school", "courses"): {
+        1: StructType([
+            StructField("course_id", StringType(), True),
+            StructField("title", StringType(), True),
+            StructField("instructor", StringType(), True),
+            StructField("category", StringType(), True),
+            StructField("price", DoubleType(), True),
+        ]),
+    },
+    ("medallion", "clientes"): {
+        1: StructType([
+            StructField("id", StringType(), False),
+            StructField("nombre", StringType(), True),
+            StructField("genero", StringType(), True),
+            StructField("fecha_nacimiento", DateType(), True),
+            StructField("correos", StringType(), True),
+            StructField("telefonos", ArrayType(StringType()), True),
+        ]),
+    },
+    ("medallion", "productos"): {
+        1: StructType([
+            StructField("id_product", IntegerType(), False),
+            StructField("nombre_producto", StringType(), True),
+            StructField("precio_unitario", DoubleType(), True),
+            StructField("categoria", StringType(), True),
+        ]),
+    },
+    ("medallion", "ventas"): {
+        1: StructType([
+            StructField("id_order", StringType(), False),
+            StructField("customer_id", StringType(), True),
+            StructField("id_product", IntegerType(), True),
+            StructField("valor_unitario", DoubleType(), True),
+            StructField("valor_descuento", DoubleType(), True),
+            StructField("unidades", IntegerType(), True),
+            StructField("total", DoubleType(), True),
+            StructField("fecha_venta", DateType(), True),
+        ]),
+        # GenMedallion particiona ventas por anio/mes: los lectores solo las obtienen si están en el esquema
+        2: StructType([
+            StructField("id_order", StringType(), False),
+            StructField("customer_id", StringType(), True),
+            StructField("id_product", IntegerType(), True),
+            StructField("valor_unitario", DoubleType(), True),
+            StructField("valor_descuento", DoubleType(), True),
+            StructField("unidades", IntegerType(), True),
+            StructField("total", DoubleType(), True),
+            StructField("fecha_venta", DateType(), True),
+            StructField("anio", IntegerType(), True),
+            StructField("mes", IntegerType(), True),
+        ]),
+    },
+    ("workshop", "orders"): {
+        1: StructType([
+            StructField("order_id", StringType(), True),
+            StructField("order_timestamp", StringType(), True),
+            StructField("customer_id", StringType(), True),
+            StructField("notifications", StructType([
+                StructField("email", BooleanType(), True),
+                StructField("sms", BooleanType(), True),
+            ]), True),
+        ]),
+    },
+    ("workshop", "status"): {
+        1: StructType([
+            StructField("order_id", StringType(), True),
+            StructField("order_status", StringType(), True),
+            StructField("status_timestamp", DoubleType(), True),
+        ]),
+    },
+    ("workshop", "customers"): {
+        1: StructType([
+            StructField("customer_id", StringType(), True),
+            StructField("name", StringType(), True),
+            StructField("email", StringType(), True),
+            StructField("address", StringType(), True),
+            StructField("city", StringType(), True),
+            StructField("state", StringType(), True),
+            StructField("zip_code", StringType(), True),
+            StructField("operation", StringType(), True),
+            StructField("timestamp", DoubleType(), True),
+        ]),
+    },
+}
+
+# COMMAND ----------
+
+def get_schema(dataset, table, version=None):
+    """
+    StructType registrado para `dataset`.`table`; la última versión si no se indica una.
+    """
+    versions = SCHEMAS.get((dataset, table))
+    if not versions:
+        raise Exception(f"No hay esquema registrado para {dataset}.{table}")
+    if version is None:
+        version = max(versions)
+    if version not in versions:
+        raise Exception(f"{dataset}.{table} no tiene la versión {version} (disponibles: {sorted(versions)})")
+    return versions[version]
+
+
+def schema_ddl(dataset, table, version=None):
+    """
+    El mismo esquema como cadena DDL, para `read_files(..., schema => ...)` o `from_json`.
+    """
+    return ", ".join(f"`{f.name}` {f.dataType.simpleString()}" for f in get_schema(dataset, table, version).fields)
+
+# COMMAND ----------
+
+def _compatible(expected, found):
+    # JSON infiere todo entero como long y todo decimal como double: no es deriva
+    if isinstance(expected, INTEGRAL_TYPES) and isinstance(found, INTEGRAL_TYPES):
+        return True
+    if isinstance(expected, FRACTIONAL_TYPES) and isinstance(found, FRACTIONAL_TYPES + INTEGRAL_TYPES):
+        return True
+    if isinstance(expected, StructType) and isinstance(found, StructType):
+        return not _diff(expected, found)
+    if isinstance(expected, ArrayType) and isinstance(found, ArrayType):
+        return _compatible(expected.elementType, found.elementType)
+    return expected.simpleString() == found.simpleString()
+
+
+def _diff(expected, found, prefix=""):
+    issues = []
+    found_fields = {f.name: f for f in found.fields}
+    expected_names = {f.name for f in expected.fields}
+    for f in expected.fields:
+        if f.name not in found_fields:
+            issues.append({"column": f"{prefix}{f.name}", "issue": "missing",
+                           "expected": f.dataType.simpleString(), "found": None})
+        elif not _compatible(f.dataType, found_fields[f.name].dataType):
+            issues.append({"column": f"{prefix}{f.name}", "issue": "type",
+                           "expected": f.dataType.simpleString(),
+                           "found": found_fields[f.name].dataType.simpleString()})
+    for f in found.fields:
+        if f.name not in expected_names and not f.name.startswith("_"):
+            issues.append({"column": f"{prefix}{f.name}", "issue": "new",
+                           "expected": None, "found": f.dataType.simpleString()})
+    return issues
+
+
+def _data_files(path):
+    # Recorre los directorios de partición (anio=2024/mes=1/...) y omite _delta_log, _checkpoint, .tmp, etc.
+    files, pending = [], [path]
+    while pending:
+        for f in dbutils.fs.ls(pending.pop()):
+            if f.name.startswith(("_", ".")):
+                continue
+            if f.isDir():
+                pending.append(f.path)
+            else:
+                files.append(f)
+    return files
+
+
+def validate_schema(path, dataset, table, file_format, sample_files=5, version=None, raise_on_drift=False):
+    """
+    Inferir el esquema de los `sample_files` archivos más recientes de `path`
+    (incluidos los de subdirectorios de partición) y compararlo con el
+    registrado. Devuelve la lista de diferencias (columna, issue =
+    missing/new/type, esperado, encontrado).
+    """
+    files = _data_files(path)
+    if not files:
+        print(f"[WARN] {path} no tiene archivos para validar")
+        return []
+    sample = [f.path for f in sorted(files, key=lambda f: f.modificationTime, reverse=True)[:sample_files]]
+    # basePath mantiene el descubrimiento de particiones aunque se lean archivos sueltos
+    found = spark.read.format(file_format).option("basePath", path).load(sample).schema
+
+    issues = _diff(get_schema(dataset, table, version), found)
+    for i in issues:
+        print(f"[WARN] {dataset}.{table}: {i['column']} {i['issue']} (esperado={i['expected']}, encontrado={i['found']})")
+    if not issues:
+        print(f"[INFO] {dataset}.{table}: sin deriva en {len(sample)} archivos de {path}")
+    if issues and raise_on_drift:
+        raise Exception(f"Deriva de esquema en {dataset}.{table}: {len(issues)} diferencias")
+    return issues
@@ -0,0 +1,188 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Materialización incremental de `sales`
+# MAGIC
+# MAGIC `CREATE OR REPLACE TABLE main.default.sales AS SELECT ...` vuelve a unir todas las facturas con clientes y
+# MAGIC productos aunque `GenFarmaDB.load_incremental` solo haya agregado unas pocas. `materialize_sales`:
+# MAGIC
+# MAGIC 1. Compara cada dimensión con su copia Delta (`<sales>_dim_customers`, `<sales>_dim_products`) mediante un
+# MAGIC    hash de sus columnas; las filas cuyo hash cambió son las dimensiones modificadas
+# MAGIC 2. Lee de `invoice_header`/`invoice_details` solo las filas con `_writetime` posterior a la marca de agua
+# MAGIC    (el filtro se empuja a la base de datos) y recalcula todas las líneas de esas facturas
+# MAGIC 3. Une esas líneas con las dimensiones en `broadcast` y hace `MERGE` por `detail_id`
+# MAGIC 4. Si una dimensión cambió, actualiza **solo** las filas de `sales` de esos clientes o productos
+# MAGIC 5. Solo entonces guarda los cambios en las copias de las dimensiones y, al final, avanza las marcas de agua
+# MAGIC
+# MAGIC Si la ejecución falla a mitad, la siguiente vuelve a detectar los mismos cambios: las copias y las marcas de
+# MAGIC agua nunca van por delante de `sales`.
+# MAGIC
+# MAGIC La primera ejecución (o `full_refresh=True`) construye la tabla completa.
+# MAGIC
+# MAGIC ```python
+# MAGIC %run ../Includes/StarJoinMaterializer
+# MAGIC
+# MAGIC materialize_sales(spark.table("invoice_header"), spark.table("invoice_details"),
+# MAGIC                   spark.table("customers"), spark.table("products"), "main.default.sales")
+# MAGIC ```
+
+# COMMAND ----------
+
+# MAGIC %run ./JdbcIncremental
+
+# COMMAND ----------
+
+from datetime import timedelta
+from pyspark.sql import functions as F
+
+# Columnas de cada dimensión que se copian a sales
+DIMENSIONS = {
+    "customers": ("customer_id", ["customer_name", "date_birthday", "email", "genero", "telephone"]),
+    "products": ("product_id", ["product_name", "category"]),
+}
+
+# COMMAND ----------
+
+def _with_hash(df, key, columns):
+    return (df.select(key, *columns)
+            .withColumn("_hash", F.sha2(F.concat_ws("||", *[F.col(c).cast("string") for c in columns]), 256)))
+
+
+def diff_dimension(name, df, target_table, full_refresh=False):
+    """
+    Comparar la dimensión `name` con su copia Delta sin modificarla. Devuelve
+    (dimensión con los valores actuales, filas nuevas o modificadas con su _hash).
+    La copia se actualiza con commit_dimension cuando sales ya tiene los cambios.
+    """
+    key, columns = DIMENSIONS[name]
+    snapshot_table = f"{target_table}_dim_{name}"
+    current = _with_hash(df, key, columns)
+
+    if full_refresh or not spark.catalog.tableExists(snapshot_table):
+        # Va al driver igual que cualquier broadcast; sales y la copia se escriben con los mismos valores
+        current = spark.createDataFrame(current.collect(), current.schema)
+        return current.drop("_hash"), current
+
+    changed = current.join(spark.table(snapshot_table).select(key, "_hash"), [key, "_hash"], "left_anti")
+    changed = spark.createDataFrame(changed.collect(), changed.schema)
+    snapshot = spark.table(snapshot_table).drop("_hash")
+    try:
+        snapshot = snapshot.cache()
+    except Exception:
+        # Serverless no permite cache; la copia es pequeña y se vuelve a leer
+        pass
+    # La copia todavía no tiene los cambios: se superponen para unir las facturas con los valores actuales
+    dimension = snapshot.join(changed.select(key), key, "left_anti").unionByName(changed.drop("_hash"))
+    return dimension, changed
+
+
+def commit_dimension(name, changed, target_table, full_refresh=False):
+    """
+    Guardar en la copia Delta de `name` las filas que devolvió diff_dimension.
+    """
+    key, _ = DIMENSIONS[name]
+    snapshot_table = f"{target_table}_dim_{name}"
+    if full_refresh or not spark.catalog.tableExists(snapshot_table):
+        changed.write.mode("overwrite").option("overwriteSchema", "true").saveAsTable(snapshot_table)
+    elif not changed.isEmpty():
+        merge_by_key(changed, snapshot_table, [key])
+
+
+def build_sales_rows(headers, details, customers, products):
+    """
+    Mismas columnas que el CREATE TABLE de 5.2, con las dimensiones en broadcast.
+    """
+    amount = F.col("di.quantity") * F.col("di.unit_price")
+    return (headers.alias("ih")
+            .join(details.alias("di"), F.col("ih.doc_id") == F.col("di.doc_id"))
+            .join(F.broadcast(customers).alias("c"), F.col("ih.customer_id") == F.col("c.customer_id"))
+            .join(F.broadcast(products).alias("p"), F.col("di.product_id") == F.col("p.product_id"))
+            .select("ih.doc_id", "ih.doc_code", "ih.doc_type", "ih.store_id", "ih.customer_id", "ih.doc_date",
+                    "di.detail_id", "di.product_id", "di.quantity", "di.unit_price", "di.discount_percent",
+                    (amount - amount * F.col("di.discount_percent") / 100).alias("total_mount"),
+                    "c.customer_name", "c.date_birthday", "c.email", "c.genero", "c.telephone",
+                    "p.product_name", "p.category",
+                    F.year("ih.doc_date").alias("anio"), F.month("ih.doc_date").alias("mes"),
+                    F.dayofmonth("ih.doc_date").alias("dia")))
+
+# COMMAND ----------
+
+def _max_writetime(df, watermark_column):
+    return df.agg(F.max(watermark_column)).collect()[0][0]
+
+
+def _apply_dimension_changes(target_table, name, changed):
+    key, columns = DIMENSIONS[name]
+    view = f"_changed_{name}"
+    changed.createOrReplaceTempView(view)
+    sets = ", ".join(f"t.`{c}` = s.`{c}`" for c in columns)
+    spark.sql(f"MERGE INTO {target_table} t USING {view} s ON t.`{key}` = s.`{key}` WHEN MATCHED THEN UPDATE SET {sets}")
+    spark.catalog.dropTempView(view)
+    return int((spark.sql(f"DESCRIBE HISTORY {target_table} LIMIT 1").collect()[0]["operationMetrics"]
+                or {}).get("numTargetRowsUpdated", 0))
+
+
+def materialize_sales(header_df, details_df, customers_df, products_df, target_table="main.default.sales",
+                      watermark_column="_writetime", overlap=timedelta(minutes=5),
+                      watermark_table=WATERMARK_TABLE, full_refresh=False):
+    """
+    Mantener `target_table` a partir de las facturas nuevas o modificadas y
+    de los cambios en clientes y productos. Devuelve un resumen de la ejecución.
+    """
+    full_refresh = full_refresh or not spark.catalog.tableExists(target_table)
+    customers, changed_customers = diff_dimension("customers", customers_df, target_table, full_refresh)
+    products, changed_products = diff_dimension("products", products_df, target_table, full_refresh)
+    report = {"mode": "full" if full_refresh else "incremental", "invoices": 0, "rows_merged": 0,
+              "customer_rows_updated": 0, "product_rows_updated": 0}
+
+    hwm_header = None if full_refresh else get_high_water_mark("invoice_header", target_table, watermark_table)
+    hwm_details = None if full_refresh else get_high_water_mark("invoice_details", target_table, watermark_table)
+
+    if hwm_header is None or hwm_details is None:
+        rows = build_sales_rows(header_df, details_df, customers, products)
+        rows.write.mode("overwrite").option("overwriteSchema", "true").saveAsTable(target_table)
+        report.update(mode="full", rows_merged=spark.table(target_table).count())
+        new_header_hwm = _max_writetime(header_df, watermark_column)
+        new_details_hwm = _max_writetime(details_df, watermark_column)
+    else:
+        # Filtros simples sobre la lectura JDBC: la base de datos solo devuelve las filas nuevas
+        new_headers = header_df.filter(F.col(watermark_column) > hwm_header - overlap).select("doc_id", watermark_column)
+        new_details = details_df.filter(F.col(watermark_column) > hwm_details - overlap).select("doc_id", watermark_column)
+        new_headers, new_details = new_headers.collect(), new_details.collect()
+        doc_ids = sorted({r["doc_id"] for r in new_headers + new_details})
+        new_header_hwm = max([r[watermark_column] for r in new_headers], default=hwm_header)
+        new_details_hwm = max([r[watermark_column] for r in new_details], default=hwm_details)
+
+        if doc_ids:
+            # Todas las líneas de cada factura tocada, aunque solo haya cambiado la cabecera
+            rows = build_sales_rows(header_df.filter(F.col("doc_id").isin(doc_ids)),
+                                    details_df.filter(F.col("doc_id").isin(doc_ids)), customers, products)
+            rows.createOrReplaceTempView("_sales_changes")
+            ids = ", ".join("'" + str(d).replace("'", "\\'") + "'" for d in doc_ids)
+            spark.sql(f"""
+                MERGE INTO {target_table} t USING _sales_changes s ON t.detail_id = s.detail_id
+                WHEN MATCHED THEN UPDATE SET *
+                WHEN NOT MATCHED THEN INSERT *
+                WHEN NOT MATCHED BY SOURCE AND t.doc_id IN ({ids}) THEN DELETE
+            """)
+            spark.catalog.dropTempView("_sales_changes")
+            metrics = spark.sql(f"DESCRIBE HISTORY {target_table} LIMIT 1").collect()[0]["operationMetrics"] or {}
+            report.update(invoices=len(doc_ids), rows_merged=int(metrics.get("numTargetRowsUpdated", 0))
+                          + int(metrics.get("numTargetRowsInserted", 0)))
+
+        if not changed_customers.isEmpty():
+            report["customer_rows_updated"] = _apply_dimension_changes(target_table, "customers", changed_customers)
+        if not changed_products.isEmpty():
+            report["product_rows_updated"] = _apply_dimension_changes(target_table, "products", changed_products)
+
+    # Las copias y las marcas de agua avanzan solo cuando sales ya refleja todos los cambios
+    commit_dimension("customers", changed_customers, target_table, full_refresh)
+    commit_dimension("products", changed_products, target_table, full_refresh)
+    if new_header_hwm is not None:
+        set_high_water_mark("invoice_header", target_table, new_header_hwm, watermark_table)
+    if new_details_hwm is not None:
+        set_high_water_mark("invoice_details", target_table, new_details_hwm, watermark_table)
+
+    print(f"[INFO] {target_table} ({report['mode']}): {report['invoices']} facturas, {report['rows_merged']} filas "
+          f"escritas, {report['customer_rows_updated']} filas por cambios en clientes, "
+          f"{report['product_rows_updated']} por cambios en productos")
+    return report
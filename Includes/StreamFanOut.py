@@ -0,0 +1,119 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Fan-out de un solo stream a bronze, silver y cuarentena
+# MAGIC
+# MAGIC En `3.3 - Multi-Hop Architecture` cada salto es una consulta aparte que vuelve a leer la tabla anterior
+# MAGIC (`clientes_raw` → `clientes_bronze` → silver). Con varias entidades eso multiplica lecturas y consultas.
+# MAGIC
+# MAGIC `start_fanout` usa **una consulta por entidad**. En cada micro-lote con `foreachBatch`:
+# MAGIC
+# MAGIC 1. Lee los archivos nuevos una sola vez y conserva el lote en memoria (`persist`)
+# MAGIC 2. Escribe bronze, aplica las reglas dqx y escribe silver (válidos) y cuarentena (inválidos)
+# MAGIC 3. Cada escritura usa `txnAppId`/`txnVersion`: si el lote se reintenta, las tablas que ya lo tenían lo ignoran,
+# MAGIC    así bronze, silver y cuarentena quedan siempre con el mismo conjunto de lotes
+# MAGIC 4. Guarda en `fanout_metrics` filas y segundos de cada salida por lote; las reglas dqx se evalúan una sola vez
+# MAGIC    sobre el lote en memoria y su costo queda en una fila aparte (`sink = 'dq'`)
+
+# COMMAND ----------
+
+import hashlib
+import time
+from pyspark.sql import functions as F
+
+METRICS_TABLE = "fanout_metrics"
+
+# COMMAND ----------
+
+def _append(df, table, app_id, batch_id):
+    start = time.time()
+    (df.write
+        .format("delta")
+        .mode("append")
+        .option("mergeSchema", "true")
+        .option("txnAppId", app_id)
+        .option("txnVersion", batch_id)
+        .saveAsTable(table))
+    return time.time() - start
+
+
+def _persist(df):
+    try:
+        return df.persist(), True
+    except Exception:
+        # Serverless no admite persist: cada acción vuelve a calcular el DataFrame
+        return df, False
+
+
+def fanout_batch(batch_df, batch_id, entity, tables, app_id, checks=None, dq_engine=None,
+                 metrics_table=METRICS_TABLE):
+    """
+    Escribir un micro-lote en `tables` ({"bronze", "silver", "quarantine"}: nombre de tabla).
+    `app_id` identifica la consulta (su checkpoint) en las escrituras idempotentes.
+    Sin `checks` todas las filas van a silver.
+    """
+    batch_df, cached = _persist(batch_df)
+    persisted = [batch_df] if cached else []
+
+    try:
+        metrics = [("bronze", batch_df.count(), _append(batch_df, tables["bronze"], app_id, batch_id))]
+
+        if checks:
+            # apply_checks_by_metadata_and_split es perezoso: las reglas se evaluarían en cada count y cada escritura.
+            # Se aplican una vez, se conserva el resultado y el costo de dqx es lo que tarda en materializarse
+            checked_df, checked_cached = _persist(dq_engine.apply_checks_by_metadata(batch_df, checks))
+            if checked_cached:
+                persisted.append(checked_df)
+                start = time.time()
+                checked_rows = checked_df.count()
+                metrics.append(("dq", checked_rows, time.time() - start))
+            # Sin persist las reglas se evalúan dentro de las escrituras de silver y cuarentena
+            valid_df, invalid_df = dq_engine.get_valid(checked_df), dq_engine.get_invalid(checked_df)
+        else:
+            valid_df, invalid_df = batch_df, None
+
+        metrics.append(("silver", valid_df.count(), _append(valid_df, tables["silver"], app_id, batch_id)))
+        if invalid_df is not None:
+            metrics.append(("quarantine", invalid_df.count(),
+                            _append(invalid_df, tables["quarantine"], app_id, batch_id)))
+    finally:
+        for df in persisted:
+            df.unpersist()
+
+    (batch_df.sparkSession
+        .createDataFrame([(entity, batch_id, sink, rows, round(seconds, 3)) for sink, rows, seconds in metrics],
+                         "entity string, batch_id long, sink string, rows long, seconds double")
+        .withColumn("recorded_at", F.current_timestamp())
+        .write.format("delta").mode("append")
+        .option("txnAppId", app_id).option("txnVersion", batch_id)
+        .saveAsTable(metrics_table))
+
+    print(f"[INFO] {entity} lote {batch_id}: " +
+          ", ".join(f"{sink}={rows} filas en {seconds:.2f}s" for sink, rows, seconds in metrics))
+
+# COMMAND ----------
+
+def start_fanout(entity, source_path, schema, checkpoint_location, checks=None, dq_engine=None,
+                 table_pattern="{entity}_{layer}", file_format="parquet", metrics_table=METRICS_TABLE):
+    """
+    Iniciar la consulta de fan-out de `entity` leyendo `source_path` con Auto Loader.
+    Las tablas destino se nombran con `table_pattern` (por defecto clientes_bronze,
+    clientes_silver, clientes_quarantine). Devuelve la StreamingQuery.
+    """
+    tables = {layer: table_pattern.format(entity=entity, layer=layer)
+              for layer in ("bronze", "silver", "quarantine")}
+    # batch_id vuelve a 0 con un checkpoint nuevo: el appId debe cambiar con él para que Delta no descarte los lotes
+    app_id = f"fanout_{entity}_{hashlib.sha256(checkpoint_location.encode()).hexdigest()[:16]}"
+    return (spark.readStream
+            .format("cloudFiles")
+            .option("cloudFiles.format", file_format)
+            .schema(schema)
+            .load(source_path)
+            .select("*",
+                    F.current_timestamp().alias("arrival_time"),
+                    F.col("_metadata.file_path").alias("source_file"))
+            .writeStream
+            .foreachBatch(lambda df, batch_id: fanout_batch(df, batch_id, entity, tables, app_id, checks,
+                                                            dq_engine, metrics_table))
+            .option("checkpointLocation", checkpoint_location)
+            .trigger(availableNow=True)
+            .start())
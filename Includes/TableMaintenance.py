@@ -0,0 +1,305 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Mantenimiento de tablas Delta guiado por estadísticas
+# MAGIC
+# MAGIC En lugar de ejecutar `OPTIMIZE`, `ZORDER` y `VACUUM` a mano (o nunca), `run_maintenance`:
+# MAGIC
+# MAGIC 1. Lee `DESCRIBE DETAIL` y el log de Delta (`_delta_log`) de cada tabla: archivos activos, histograma de
+# MAGIC    tamaños, proporción de archivos pequeños y bytes de archivos eliminados que `VACUUM` borraría hoy
+# MAGIC    (tombstones más antiguos que `delta.deletedFileRetentionDuration`, 7 días por defecto)
+# MAGIC 2. Decide qué vale la pena: `OPTIMIZE` si hay muchos archivos pequeños, `ZORDER BY` por las columnas más usadas
+# MAGIC    en predicados (historial de la tabla y consultas de referencia) y `VACUUM` si los tombstones pesan
+# MAGIC 3. Ejecuta primero `OPTIMIZE`/`ZORDER` y después `VACUUM` (dentro de cada tipo, de mayor a menor beneficio)
+# MAGIC    sin pasarse de `time_budget_seconds`
+# MAGIC 4. Mide una consulta de referencia antes y después y guarda el reporte en `maintenance_report`
+# MAGIC
+# MAGIC ```python
+# MAGIC %run ../Includes/TableMaintenance
+# MAGIC
+# MAGIC run_maintenance(["orders_updates", "clientes_bronze"], time_budget_seconds=600,
+# MAGIC                 reference_queries={"orders_updates": "SELECT count(*) FROM orders_updates WHERE customer_id = '3'"})
+# MAGIC ```
+# MAGIC
+# MAGIC Si el log no se puede leer directamente (por ejemplo, tablas administradas en Unity Catalog sin acceso a la
+# MAGIC ruta), se usan los totales de `DESCRIBE DETAIL` y las métricas de `DESCRIBE HISTORY`.
+
+# COMMAND ----------
+
+import math
+import re
+import time
+from pyspark.sql import functions as F
+from pyspark.sql.window import Window
+
+MB = 1024 * 1024
+
+# Límites superiores de cada grupo del histograma de tamaños
+SIZE_BUCKETS = [("<1MB", 1 * MB), ("1-8MB", 8 * MB), ("8-32MB", 32 * MB), ("32-128MB", 128 * MB),
+                ("128-512MB", 512 * MB), (">=512MB", None)]
+
+REPORT_TABLE = "maintenance_report"
+
+# Retención por defecto de los archivos eliminados antes de que VACUUM pueda borrarlos
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600
+RETENTION_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400, "week": 604800}
+
+# Orden de ejecución: compactar antes de limpiar (OPTIMIZE también genera tombstones)
+ACTION_PRIORITY = {"OPTIMIZE": 0, "ZORDER": 0, "VACUUM": 1}
+
+# COMMAND ----------
+
+def _log_actions(location):
+    """
+    Última acción (add/remove) de cada archivo según checkpoints y commits JSON del log.
+    """
+    log = f"{location}/_delta_log"
+    frames = [spark.read.json(f"{log}/*.json")
+              .withColumn("version", F.regexp_extract("_metadata.file_name", r"^(\d+)", 1).cast("long"))]
+    try:
+        frames.append(spark.read.parquet(f"{log}/*.checkpoint*.parquet")
+                      .withColumn("version", F.regexp_extract("_metadata.file_name", r"^(\d+)", 1).cast("long")))
+    except Exception as e:
+        if "PATH_NOT_FOUND" not in str(e) and "Path does not exist" not in str(e):
+            raise
+
+    actions = []
+    for df in frames:
+        for action in ("add", "remove"):
+            if action not in df.columns:
+                continue
+            fields = df.schema[action].dataType.fieldNames()
+            size = F.col(f"{action}.size") if "size" in fields else F.lit(None).cast("long")
+            deleted_at = (F.col(f"{action}.deletionTimestamp") if "deletionTimestamp" in fields
+                          else F.lit(None).cast("long"))
+            actions.append(df.where(F.col(action).isNotNull())
+                           .select(F.col(f"{action}.path").alias("path"), size.alias("size"),
+                                   F.lit(action).alias("action"), "version",
+                                   deleted_at.alias("deletion_timestamp")))
+    if not actions:
+        return None
+
+    df = actions[0]
+    for other in actions[1:]:
+        df = df.unionByName(other)
+    latest = Window.partitionBy("path").orderBy(F.col("version").desc(), F.col("action").asc())
+    return df.withColumn("_rn", F.row_number().over(latest)).filter("_rn = 1").drop("_rn")
+
+
+def retention_seconds(detail):
+    """
+    `delta.deletedFileRetentionDuration` de la tabla en segundos ("interval 7 days", "168 hours", ...).
+    """
+    value = (detail.get("properties") or {}).get("delta.deletedFileRetentionDuration")
+    match = re.search(r"(\d+)\s*(second|minute|hour|day|week)", value or "", re.IGNORECASE)
+    if not match:
+        return DEFAULT_RETENTION_SECONDS
+    return int(match.group(1)) * RETENTION_UNITS[match.group(2).lower()]
+
+
+def _vacuum_window(table, retention):
+    """
+    (desde, hasta) en epoch ms de las eliminaciones que VACUUM borraría ahora:
+    más antiguas que la retención y no cubiertas por el último VACUUM.
+    """
+    rows = (spark.sql(f"DESCRIBE HISTORY {table}")
+            .filter(F.col("operation").startswith("VACUUM"))
+            .agg(F.max("timestamp").alias("ts")).collect())
+    last_vacuum = rows[0]["ts"] if rows else None
+    since = (last_vacuum.timestamp() - retention) * 1000 if last_vacuum is not None else 0
+    return since, (time.time() - retention) * 1000
+
+
+def _history_tombstone_bytes(table, since_ms, until_ms):
+    """
+    Bytes eliminados por commits entre `since_ms` y `until_ms`, según operationMetrics del historial.
+    """
+    removed = 0
+    for h in spark.sql(f"DESCRIBE HISTORY {table}").collect():
+        committed_ms = h["timestamp"].timestamp() * 1000
+        if h["operation"].startswith("VACUUM") or not since_ms <= committed_ms < until_ms:
+            continue
+        metrics = h["operationMetrics"] or {}
+        removed += int(metrics.get("numRemovedBytes") or metrics.get("numTargetBytesRemoved") or 0)
+    return removed
+
+
+def table_stats(table, small_file_bytes=32 * MB):
+    """
+    Archivos, histograma de tamaños, archivos pequeños y bytes que VACUUM
+    puede recuperar hoy en `table` (tombstones fuera de la retención).
+    """
+    detail = spark.sql(f"DESCRIBE DETAIL {table}").collect()[0].asDict()
+    retention = retention_seconds(detail)
+    since_ms, until_ms = _vacuum_window(table, retention)
+    stats = {
+        "table": table,
+        "num_files": detail["numFiles"],
+        "size_bytes": detail["sizeInBytes"],
+        "partition_columns": detail.get("partitionColumns") or [],
+        "clustering_columns": detail.get("clusteringColumns") or [],
+        "histogram": None,
+        "retention_hours": retention / 3600,
+        "source": "delta_log",
+    }
+
+    try:
+        actions = _log_actions(detail["location"])
+    except Exception as e:
+        print(f"[WARN] {table}: no se pudo leer el log ({type(e).__name__}), se usa DESCRIBE HISTORY")
+        actions = None
+
+    if actions is not None:
+        bucket = F.lit(SIZE_BUCKETS[-1][0])
+        for name, upper in reversed(SIZE_BUCKETS[:-1]):
+            bucket = F.when(F.col("size") < upper, name).otherwise(bucket)
+        row = actions.agg(
+            F.sum(F.when((F.col("action") == "add") & (F.col("size") < small_file_bytes), 1).otherwise(0)).alias("small"),
+            # VACUUM solo borra los remove más antiguos que la retención; los que ya lo eran en el último
+            # VACUUM ya no ocupan espacio
+            F.sum(F.when((F.col("action") == "remove") & (F.col("deletion_timestamp") >= since_ms)
+                         & (F.col("deletion_timestamp") < until_ms),
+                         F.col("size")).otherwise(0)).alias("tombstones"),
+        ).collect()[0]
+        histogram = {r["bucket"]: r["files"] for r in
+                     actions.filter("action = 'add'").groupBy(bucket.alias("bucket"))
+                     .agg(F.count(F.lit(1)).alias("files")).collect()}
+        stats["histogram"] = {name: histogram.get(name, 0) for name, _ in SIZE_BUCKETS}
+        stats["small_files"] = int(row["small"] or 0)
+        stats["tombstone_bytes"] = int(row["tombstones"] or 0)
+    else:
+        stats["source"] = "history"
+        avg_size = stats["size_bytes"] / stats["num_files"] if stats["num_files"] else 0
+        stats["small_files"] = stats["num_files"] if avg_size < small_file_bytes else 0
+        stats["tombstone_bytes"] = _history_tombstone_bytes(table, since_ms, until_ms)
+
+    stats["small_file_ratio"] = round(stats["small_files"] / stats["num_files"], 3) if stats["num_files"] else 0.0
+    return stats
+
+# COMMAND ----------
+
+def filtered_columns(table, reference_queries=(), top_n=2):
+    """
+    Columnas de `table` que más aparecen en predicados: los de MERGE/UPDATE/DELETE
+    del historial y las cláusulas WHERE de las consultas de referencia.
+    """
+    columns = [c.lower() for c in spark.table(table).columns]
+    texts = []
+    for h in spark.sql(f"DESCRIBE HISTORY {table}").select("operationParameters").collect():
+        params = h["operationParameters"] or {}
+        texts.extend(v for k, v in params.items() if "predicate" in k.lower() and v)
+    for q in reference_queries:
+        match = re.search(r"\bwhere\b(.*?)(\bgroup\b|\border\b|\blimit\b|$)", q, re.IGNORECASE | re.DOTALL)
+        if match:
+            texts.append(match.group(1))
+
+    counts = {}
+    for text in texts:
+        for token in re.findall(r"[A-Za-z_][A-Za-z0-9_]*", text):
+            if token.lower() in columns:
+                counts[token.lower()] = counts.get(token.lower(), 0) + 1
+    return [c for c, _ in sorted(counts.items(), key=lambda kv: -kv[1])][:top_n]
+
+
+def advise(stats, zorder_columns=None, target_file_bytes=128 * MB, min_files=8, small_file_ratio=0.5,
+           vacuum_min_bytes=256 * MB, vacuum_ratio=0.2, bytes_per_second=100 * MB):
+    """
+    Acciones recomendadas para una tabla a partir de `table_stats`, con motivo,
+    beneficio estimado (archivos o bytes a recuperar) y segundos estimados.
+    """
+    table = stats["table"]
+    actions = []
+    expected_files = max(1, math.ceil(stats["size_bytes"] / target_file_bytes))
+    if stats["num_files"] >= min_files and stats["small_file_ratio"] >= small_file_ratio \
+            and stats["num_files"] > 2 * expected_files:
+        zorder = [c for c in (zorder_columns or []) if c not in stats["partition_columns"]]
+        if stats["clustering_columns"] or not zorder:
+            sql, action = f"OPTIMIZE {table}", "OPTIMIZE"
+        else:
+            sql, action = f"OPTIMIZE {table} ZORDER BY ({', '.join(zorder)})", "ZORDER"
+        actions.append({
+            "table": table, "action": action, "sql": sql,
+            "reason": f"{stats['small_files']}/{stats['num_files']} archivos pequeños (esperados ~{expected_files})",
+            "benefit": stats["num_files"] - expected_files,
+            "estimated_seconds": stats["size_bytes"] / bytes_per_second,
+        })
+
+    tombstones = stats["tombstone_bytes"]
+    if tombstones >= vacuum_min_bytes or (stats["size_bytes"] and tombstones / stats["size_bytes"] >= vacuum_ratio):
+        actions.append({
+            "table": table, "action": "VACUUM", "sql": f"VACUUM {table}",
+            "reason": f"{tombstones / MB:.1f}MB en archivos eliminados hace más de {stats['retention_hours']:g}h",
+            "benefit": tombstones / target_file_bytes,
+            "estimated_seconds": 10 + tombstones / (10 * bytes_per_second),
+        })
+    return actions
+
+# COMMAND ----------
+
+def _time_query(query):
+    if not query:
+        return None
+    start = time.time()
+    spark.sql(query).write.format("noop").mode("overwrite").save()
+    return round(time.time() - start, 3)
+
+
+def run_maintenance(tables, time_budget_seconds=600, reference_queries=None, zorder_columns=None,
+                    dry_run=False, report_table=REPORT_TABLE, **advise_options):
+    """
+    Analizar `tables`, ejecutar las acciones recomendadas dentro de
+    `time_budget_seconds` y guardar el reporte. `reference_queries` es
+    {tabla: consulta} y `zorder_columns` {tabla: [columnas]} para no inferirlas.
+    """
+    reference_queries = reference_queries or {}
+    zorder_columns = zorder_columns or {}
+
+    plan, stats_before = [], {}
+    for table in tables:
+        stats_before[table] = table_stats(table)
+        query = reference_queries.get(table)
+        columns = zorder_columns.get(table) or filtered_columns(table, [query] if query else [])
+        plan.extend(advise(stats_before[table], columns, **advise_options))
+    # benefit está en archivos para OPTIMIZE y en bytes para VACUUM: solo se compara dentro de cada tipo
+    plan.sort(key=lambda a: (ACTION_PRIORITY[a["action"]], -a["benefit"]))
+
+    timings_before = {t: _time_query(reference_queries.get(t)) for t in tables}
+    start = time.time()
+    for action in plan:
+        remaining = time_budget_seconds - (time.time() - start)
+        if dry_run:
+            action["status"] = "dry_run"
+        elif action["estimated_seconds"] > remaining:
+            action["status"] = "skipped_budget"
+        else:
+            action_start = time.time()
+            spark.sql(action["sql"])
+            action["seconds"] = round(time.time() - action_start, 2)
+            action["status"] = "done"
+        print(f"[INFO] {action['status']}: {action['sql']} ({action['reason']})")
+
+    report = []
+    for table in tables:
+        after = table_stats(table) if not dry_run else stats_before[table]
+        before = stats_before[table]
+        report.append({
+            "table": table,
+            "actions": ", ".join(f"{a['action']}:{a['status']}" for a in plan if a["table"] == table),
+            "files_before": before["num_files"], "files_after": after["num_files"],
+            "small_file_ratio_before": float(before["small_file_ratio"]),
+            "small_file_ratio_after": float(after["small_file_ratio"]),
+            "tombstone_bytes_before": before["tombstone_bytes"], "tombstone_bytes_after": after["tombstone_bytes"],
+            "histogram_before": str(before["histogram"]), "histogram_after": str(after["histogram"]),
+            "query_seconds_before": timings_before[table],
+            "query_seconds_after": _time_query(reference_queries.get(table)) if not dry_run else None,
+        })
+
+    df = (spark.createDataFrame(report, """
+              table string, actions string, files_before long, files_after long,
+              small_file_ratio_before double, small_file_ratio_after double,
+              tombstone_bytes_before long, tombstone_bytes_after long,
+              histogram_before string, histogram_after string,
+              query_seconds_before double, query_seconds_after double""")
+          .withColumn("run_at", F.current_timestamp()))
+    if not dry_run:
+        df.write.mode("append").saveAsTable(report_table)
+    return df